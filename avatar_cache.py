@@ -0,0 +1,85 @@
+"""
+Cache of user avatars, already resized and cropped into circles for the size they are drawn at.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+
+import metrics
+from common import crop_circle
+
+CDN_SIZES = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)  # sizes the Discord CDN can serve
+MAX_BYTES = 16 * 1024 * 1024  # memory used by cached images before the least recently used are dropped
+
+_hits = metrics.CACHE_REQUESTS.labels("avatar", "hit")
+_misses = metrics.CACHE_REQUESTS.labels("avatar", "miss")
+
+_cache = OrderedDict()  # (avatar hash, size): cropped RGBA image, least recently used first
+_cache_bytes = 0
+_loading = {}  # (avatar hash, size): task fetching that avatar
+
+
+def _cdn_size(size: int) -> int:
+    """
+    Returns the smallest size the CDN serves that is at least `size`.
+    """
+    return next((s for s in CDN_SIZES if s >= size), CDN_SIZES[-1])
+
+
+def _image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+def _add(key, image: Image.Image) -> None:
+    global _cache_bytes
+    _cache[key] = image
+    _cache_bytes += _image_bytes(image)
+    while _cache_bytes > MAX_BYTES and len(_cache) > 1:
+        _, dropped = _cache.popitem(last=False)
+        _cache_bytes -= _image_bytes(dropped)
+
+
+async def _fetch(asset, size: int) -> Image.Image:
+    data = await asset.with_size(_cdn_size(size)).read()
+    image = Image.open(BytesIO(data)).convert("RGBA")
+    return crop_circle(image.resize((size, size)))
+
+
+async def get_avatar(user, size: int) -> Image.Image:
+    """
+    Returns the avatar of a user as a `size` x `size` circle, fetching it only if it isn't cached.
+    """
+    asset = user.display_avatar
+    key = (asset.key, size)
+    if key in _cache:
+        _hits.inc()
+        _cache.move_to_end(key)
+        return _cache[key]
+    _misses.inc()
+
+    # share a single download between everyone asking for the same avatar
+    if key not in _loading:
+        _loading[key] = asyncio.ensure_future(_fetch(asset, size))
+        _loading[key].add_done_callback(lambda _: _loading.pop(key, None))
+    # the download keeps going for the others waiting on it even if this caller is cancelled
+    image = await asyncio.shield(_loading[key])
+
+    if key not in _cache:
+        _add(key, image)
+    return image
+
+
+async def get_avatars(users, size: int) -> list[Image.Image | None]:
+    """
+    Returns the avatars of several users at once. Avatars that aren't cached are fetched concurrently.
+    Users that are `None` get a `None` avatar.
+    """
+    async def get(user):
+        return await get_avatar(user, size) if user else None
+
+    return list(await asyncio.gather(*map(get, users)))
@@ -1,19 +1,31 @@
 import discord
-from PIL import ImageDraw, ImageFont, ImageOps, Image
-
-from user_data import get_user_data
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
+from PIL import ImageDraw, ImageFont, Image
+
+import avatar_cache
+import render_pool
+import user_cache
+from user_data import UserData
 from dmoj import fetch_points
 from levels import get_next_level_experience, get_next_level_percentage
 
 from common import (
     BLACK, WHITE, GREEN, BLUE, ORANGE, YELLOW,
     FONT_PATH,
-    draw_user_avatar, text_shadow
+    draw_avatar, image_to_buffer, text_shadow
 )
 
 font_side = ImageFont.truetype(FONT_PATH, 30)
 font_experience = ImageFont.truetype(FONT_PATH, 25)
 
+PROGRESS_BAR_BOX = (175, 95, 425, 130)
+# the font is monospaced, so labels can be drawn once in the template and the values next to them
+STATISTICS_LABELS = [((490, 25), "CCC Points: "), ((490, 65), "Level: "), ((490, 105), "XP: "),
+                     ((490, 145), "Messages: ")]
+EXPERIENCE_LABEL = ((185, 150), "XP: ")
+
 
 def _create_base_image():
     """
@@ -40,32 +52,67 @@ def draw_progress_bar_inside(bar_inside_image, width: int, height: int, percenta
     bar_inside_draw.polygon(points, YELLOW)
 
 
-def draw_progress_bar(draw, dest, bounding_box, percentage: float) -> None:
+@lru_cache
+def _progress_bar_mask(size):
+    """
+    Mask of the inside of a progress bar of the given size.
+    """
+    mask = Image.new("L", size, 1)
+    mask_draw = ImageDraw.Draw(mask)
+    mask_draw.rounded_rectangle(((0, 0), size), 16, 255, 0, 3)
+    return mask
+
+
+def draw_progress_bar_frame(draw, bounding_box) -> None:
+    """
+    Draws the empty frame of a progress bar, which `draw_progress_bar` fills in.
+    """
+    draw.rounded_rectangle(bounding_box, 16, WHITE, ORANGE, 3)
+
+
+def draw_progress_bar(dest, bounding_box, percentage: float) -> None:
     """
-    Draws a progress bar onto the destination image.
+    Draws the inside of a progress bar onto the destination image, which must already contain its frame.
     """
     # Get the size of the progress bar
     width = bounding_box[2] - bounding_box[0]
     height = bounding_box[3] - bounding_box[1]
     size = (width, height)
 
-    # Create a mask
-    mask = Image.new("L", size, 1)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.rounded_rectangle(((0, 0), size), 16, 255, 0, 3)
-
     # Create an image for the inside of the bar
     bar_inside = Image.new("RGB", size, WHITE)
     draw_progress_bar_inside(bar_inside, width, height, percentage)
-    # Crop the image using the mask
-    inside_masked = ImageOps.fit(bar_inside, mask.size, centering=(0.5, 0.5))
-    inside_masked.putalpha(mask)
 
-    # Draw the rectangle
-    draw.rounded_rectangle(bounding_box, 16, WHITE, ORANGE, 3)
+    # Draw the progress bar, cropped to the inside of the frame
+    dest.paste(bar_inside, bounding_box[:2], _progress_bar_mask(size))
 
-    # Draw the progress bar
-    dest.paste(inside_masked, bounding_box[:2], inside_masked)
+
+@lru_cache
+def _template():
+    """
+    Everything that is the same on every banner: the background, the empty progress bar and the labels.
+    """
+    img = Image.open("assets/fetch_points_base.png")
+    img.load()
+    draw = ImageDraw.Draw(img)
+    draw_progress_bar_frame(draw, PROGRESS_BAR_BOX)
+    for position, label in STATISTICS_LABELS:
+        text_shadow(draw, position, label, font_side)
+    draw.text(EXPERIENCE_LABEL[0], EXPERIENCE_LABEL[1], BLACK, font_experience)
+    return img
+
+
+def _after_label(label_position, label: str, font):
+    """
+    Returns the position right after a label drawn in the template.
+    """
+    x, y = label_position
+    return x + int(font.getlength(label)), y
+
+
+@lru_cache
+def _username_font(size: int):
+    return ImageFont.truetype(FONT_PATH, size)
 
 
 def abbreviate_integer(value: int) -> str:
@@ -78,48 +125,70 @@ def abbreviate_integer(value: int) -> str:
         return str(value)
 
 
-def make_banner(user: discord.User) -> str:
+@dataclass
+class BannerData:
+    """
+    Everything needed to render a banner. Sent to the render pool, so it must be picklable.
+    """
+    name: str
+    avatar: Image.Image
+    user_data: UserData
+    points: int
+
+
+async def make_banner(user: discord.User) -> BytesIO:
     """
     Generates a banner for the given user.
-    Returns the filename of the generated banner.
+    Returns the generated banner as an in-memory PNG.
     """
-    img = Image.open("assets/fetch_points_base.png")
-    img.load()
+    # Get user data
+    user_data = await user_cache.get_user(user.id)
+    data = BannerData(
+        name=user.name,
+        avatar=await avatar_cache.get_avatar(user, 120),
+        user_data=user_data,
+        points=await fetch_points(user_data.dmoj_username)
+    )
+    return await render_pool.run(render_banner, data)
+
 
+def render_banner(data: BannerData) -> BytesIO:
+    """
+    Draws the banner. Runs in the render pool.
+    Returns the generated banner as an in-memory PNG.
+    """
+    img = _template().copy()
     draw = ImageDraw.Draw(img)
 
-    draw_user_avatar(user, img, 120, (30, 20))
+    draw_avatar(data.avatar, img, (30, 20))
 
     # Write the user's name
-    name_length = len(user.name)
+    name_length = len(data.name)
     if name_length <= 12:
         font_username_size = 38
         name_text_y = 36
     else:
         font_username_size = round(38 * 12 / name_length)
         name_text_y = 36 + (name_length - 12) // 2
-    font_username = ImageFont.truetype(FONT_PATH, font_username_size)
-    draw.text((175, name_text_y), user.name, BLACK, font=font_username)
+    font_username = _username_font(font_username_size)
+    draw.text((175, name_text_y), data.name, BLACK, font=font_username)
 
-    # Get user data
-    user_data = get_user_data(user.id)
+    user_data = data.user_data
 
     # Draw the progress bar
     next_level_percentage = get_next_level_percentage(user_data)
-    draw_progress_bar(draw, img, (175, 95, 425, 130), next_level_percentage)
+    draw_progress_bar(img, PROGRESS_BAR_BOX, next_level_percentage)
 
     # Write statistics
-    points = fetch_points(user_data.dmoj_username)
-    text_shadow(draw, (490, 25), f"CCC Points: {points:,}", font_side)
-    text_shadow(draw, (490, 65), f"Level: {user_data.level:,}", font_side)
-    text_shadow(draw, (490, 105), f"XP: {user_data.experience:,}", font_side)
-    text_shadow(draw, (490, 145), f"Messages: {user_data.messages:,}", font_side)
+    statistics = [data.points, user_data.level, user_data.experience, user_data.messages]
+    for (position, label), value in zip(STATISTICS_LABELS, statistics):
+        text_shadow(draw, _after_label(position, label, font_side), f"{value:,}", font_side)
 
     # Write experience under the progress bar
     experience_str = abbreviate_integer(user_data.experience)
     next_level = get_next_level_experience(user_data.level)
     next_level_str = abbreviate_integer(next_level)
-    draw.text((185, 150), f"XP: {experience_str} / {next_level_str}", BLACK, font_experience)
+    draw.text(_after_label(*EXPERIENCE_LABEL, font_experience), f"{experience_str} / {next_level_str}", BLACK,
+              font_experience)
 
-    img.save("assets/temp_banner.png")
-    return "assets/temp_banner.png"
+    return image_to_buffer(img)
@@ -0,0 +1,40 @@
+"""
+Measures how long `banner.render_banner` takes per banner.
+Runs offline; run from the repository root with `python -m benchmarks.banner`.
+"""
+
+import time
+
+from PIL import Image
+
+from banner import BannerData, render_banner
+from common import crop_circle
+from user_data import UserData
+
+ITERATIONS = 200
+
+
+def fake_banner_data(name: str) -> BannerData:
+    avatar = crop_circle(Image.new("RGBA", (120, 120), (200, 30, 30, 255)))
+    user_data = UserData(user_id=1, dmoj_username="someone", level=7, experience=12_345, messages=678,
+                         next_experience_gain_time=0)
+    return BannerData(name=name, avatar=avatar, user_data=user_data, points=321)
+
+
+def bench_render_banner(iterations: int = ITERATIONS) -> float:
+    """
+    Returns the average time to render a banner, in milliseconds.
+    Alternates between names of different lengths, so different font sizes are needed.
+    """
+    data = [fake_banner_data("short"), fake_banner_data("a_rather_long_username"),
+            fake_banner_data("another_long_username!")]
+    render_banner(data[0])  # the first render loads fonts and images
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        render_banner(data[i % len(data)])
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+if __name__ == '__main__':
+    print(f"render_banner: {bench_render_banner():.2f} ms per banner")
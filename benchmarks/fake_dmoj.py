@@ -0,0 +1,177 @@
+"""
+Local stand-in for the parts of DMOJ the bot uses, built from the repository's fixtures.
+Every user has the submissions in `dummy_submissions.json`, and problems come from `problem_info.json`.
+
+Latency, submission page size and injected errors can be configured, so the bot can be load tested
+without sending any traffic to dmoj.ca. To point the bot at a running stand-in, set `DMOJ_BASE_URL`:
+    python -m benchmarks.fake_dmoj --port 8000 --latency 0.1
+    DMOJ_BASE_URL=http://127.0.0.1:8000 python main.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+from aiohttp import web
+
+from problem_catalog import CATALOG_PATH
+
+SUBMISSIONS_PATH = "dummy_submissions.json"
+PROBLEMS_PER_PAGE = 50  # page size of the problem list on DMOJ
+
+
+class FakeDMOJ:
+    """
+    Serves `/api/v2/submissions`, `/api/v2/user/<name>`, `/api/v2/problem/<code>`,
+    `/user/<name>/solved` and `/problems/`.
+
+    Every response is delayed by `latency` plus up to `jitter` seconds,
+    and a random `error_rate` of them fail with `error_status` instead.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, page_size: int = 1000,
+                 error_rate: float = 0.0, error_status: int = 500):
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+
+        with open(SUBMISSIONS_PATH, "r") as dummy_data:
+            self.submissions = json.load(dummy_data)["data"]["objects"]
+        for sub in self.submissions:
+            if sub["points"] == "None":  # the fixture stores missing points as a string
+                sub["points"] = None
+        with open(CATALOG_PATH, "r") as problem_types:
+            self.problems = json.load(problem_types)
+        self.solved = sorted({sub["problem"] for sub in self.submissions if sub["result"] == "AC"})
+
+        self.app = web.Application(middlewares=[self._delay_and_fail])
+        self.app.router.add_get("/api/v2/submissions", self.submissions_page)
+        self.app.router.add_get("/api/v2/user/{name}", self.user)
+        self.app.router.add_get("/api/v2/problem/{code}", self.problem)
+        self.app.router.add_get("/user/{name}/solved", self.solved_page)
+        self.app.router.add_get("/problems/", self.problem_list)
+        self._runner = None
+
+    @web.middleware
+    async def _delay_and_fail(self, request: web.Request, handler):
+        self.requests += 1
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=self.error_status, text="Injected error")
+        return await handler(request)
+
+    @staticmethod
+    def _json(request: web.Request, data: dict) -> web.Response:
+        """
+        Returns `data` with an ETag, or 304 if the client already has it, like DMOJ's API.
+        """
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    async def submissions_page(self, request: web.Request) -> web.Response:
+        page = int(request.query.get("page", 1))
+        n_pages = max(-(-len(self.submissions) // self.page_size), 1)
+        if page > n_pages:
+            raise web.HTTPNotFound()
+        objects = self.submissions[(page - 1) * self.page_size:page * self.page_size]
+        return self._json(request, {"data": {"objects": objects, "total_pages": n_pages}})
+
+    async def user(self, request: web.Request) -> web.Response:
+        return self._json(request, {"data": {"object": {
+            "username": request.match_info["name"],
+            "problem_count": len(self.solved),
+            "solved_problems": self.solved,
+        }}})
+
+    async def problem(self, request: web.Request) -> web.Response:
+        code = request.match_info["code"]
+        if code not in self.problems:
+            raise web.HTTPNotFound()
+        info = self.problems[code]
+        return self._json(request, {"data": {"object": {"code": code, **info}}})
+
+    async def solved_page(self, request: web.Request) -> web.Response:
+        groups = {}
+        for code in self.solved:
+            group = code[:3].upper()
+            if code in self.problems and group in ("CCC", "CCO"):
+                groups[group] = groups.get(group, 0) + self.problems[code]["points"]
+        headers = "".join(
+            f'<div class="unselectable toggle closed">{group} ({points:.1f} points)</div>'
+            for group, points in groups.items()
+        )
+        return web.Response(text=f"<html><body>{headers}</body></html>", content_type="text/html")
+
+    async def problem_list(self, request: web.Request) -> web.Response:
+        page = int(request.query.get("page", 1))
+        codes = list(self.problems)
+        n_pages = max(-(-len(codes) // PROBLEMS_PER_PAGE), 1)
+        if page > n_pages:
+            raise web.HTTPNotFound()
+
+        rows = []
+        for code in codes[(page - 1) * PROBLEMS_PER_PAGE:page * PROBLEMS_PER_PAGE]:
+            info = self.problems[code]
+            types = "".join(f"<span>{t}</span>" for t in info["types"])
+            rows.append(f'<tr><td class="problem"><a href="/problem/{code}">{code}</a></td>'
+                        f'<td class="types">{types}</td><td class="p">{info["points"]}p</td></tr>')
+        pagination = "".join(f'<li><a href="?page={p}">{p}</a></li>' for p in (1, 2, n_pages))
+        html = f'<html><body><table>{"".join(rows)}</table><ul class="pagination">{pagination}</ul></body></html>'
+        return web.Response(text=html, content_type="text/html")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Starts serving, on a free port if `port` is 0. Returns the server's base URL.
+        """
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(server: FakeDMOJ, port: int) -> None:
+    url = await server.start(port=port)
+    print(f"Fake DMOJ serving on {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for DMOJ")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, at random")
+    parser.add_argument("--page-size", type=int, default=1000, help="submissions per page")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="status of the failed requests")
+    args = parser.parse_args()
+    server = FakeDMOJ(args.latency, args.jitter, args.page_size, args.error_rate, args.error_status)
+    try:
+        asyncio.run(serve(server, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
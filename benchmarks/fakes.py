@@ -0,0 +1,78 @@
+"""
+Stand-ins for the Discord objects the bot's handlers use, so they can run without a Discord connection.
+"""
+
+from io import BytesIO
+
+from PIL import Image
+
+
+def _avatar_png(seed: int) -> bytes:
+    color = (seed * 67 % 256, seed * 151 % 256, seed * 31 % 256, 255)
+    buffer = BytesIO()
+    Image.new("RGBA", (128, 128), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeAsset:
+    """
+    An avatar whose image is generated locally instead of downloaded from the CDN.
+    """
+
+    def __init__(self, key: str, data: bytes):
+        self.key = key
+        self.data = data
+
+    def with_size(self, size: int):
+        return self
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.display_avatar = FakeAsset(f"avatar{user_id}", _avatar_png(user_id))
+
+
+class FakeBot:
+    """
+    Knows a fixed set of users, like `discord.Bot.get_user`.
+    """
+
+    def __init__(self, users):
+        self.users = {user.id: user for user in users}
+
+    def get_user(self, user_id: int):
+        return self.users.get(user_id)
+
+
+class FakeFollowup:
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    async def send(self, content=None, **kwargs):
+        await self.ctx.respond(content, **kwargs)
+
+
+class FakeContext:
+    """
+    The context of a slash command invoked by `author`. Keeps every response instead of sending it.
+    """
+
+    def __init__(self, author: FakeUser):
+        self.author = author
+        self.channel = None
+        self.followup = FakeFollowup(self)
+        self.responses = []
+        self.rejected = False  # set by the load harness if the command's job was rejected by the scheduler
+
+    async def defer(self, **kwargs):
+        pass
+
+    async def respond(self, content=None, *, file=None, ephemeral=False, **kwargs):
+        if file is not None:
+            file.close()
+        self.responses.append(content)
@@ -0,0 +1,159 @@
+"""
+Load test of the bot's commands against the local DMOJ stand-in (`benchmarks.fake_dmoj`).
+Calls the slash command handlers from `main.py` with fake contexts, without a Discord connection,
+and reports the latency percentiles of each command.
+Requests rejected by the job scheduler are counted separately and left out of the percentiles.
+Run from the repository root, for example:
+    python -m benchmarks.load --concurrency 16 --requests 100 --latency 0.05 --error-rate 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+import dmoj_client
+import jobs
+import rank_index
+import render_pool
+import submission_store
+import user_cache
+from benchmarks.fake_dmoj import FakeDMOJ
+from benchmarks.fakes import FakeBot, FakeContext, FakeUser
+from user_data import UserData
+
+# slash command: options it is invoked with
+COMMANDS = {
+    "plot_points": {"user": None},
+    "plot_problems": {"user": None},
+    "plot_problem_types": {"users": None},
+    "plot_problem_types_weighted": {"users": None},
+    "fetch_points": {"user": None},
+    "leaderboard": {"page": 1, "around_me": False},
+}
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+
+
+def seed_members(n_members: int) -> list[FakeUser]:
+    """
+    Adds `n_members` members with connected DMOJ accounts, like they would be after loading from the database.
+    """
+    members = [FakeUser(i, f"member_{i}") for i in range(1, n_members + 1)]
+    for i, member in enumerate(members):
+        user_cache.put(UserData(user_id=member.id, dmoj_username=member.name, level=i, experience=i * 1000,
+                                messages=i, next_experience_gain_time=0))
+    rank_index._loaded = True  # every member was added through user_cache above; there is no database
+    return members
+
+
+async def run_load(commands: list[str], n_requests: int, concurrency: int, members: list[FakeUser]) -> dict:
+    """
+    Invokes each command `n_requests` times, by random members, with at most `concurrency` running at once.
+    Returns the latencies and numbers of errors and rejections of each command.
+    """
+    import main  # after the DMOJ client points at the stand-in
+
+    main.bot.get_user = FakeBot(members).get_user  # the bot isn't connected, so it knows no users
+    run_image_job = main.run_image_job
+
+    async def record_rejections(ctx, *args):  # the handlers answer rejections with a message instead of raising
+        try:
+            return await run_image_job(ctx, *args)
+        except jobs.JobRejected:
+            ctx.rejected = True
+            raise
+
+    main.run_image_job = record_rejections
+    handlers = {command.name: command.callback for command in main.bot.pending_application_commands}
+
+    invocations = [name for name in commands for _ in range(n_requests)]
+    random.shuffle(invocations)
+    latencies = {name: [] for name in commands}
+    errors = {name: 0 for name in commands}
+    rejections = {name: 0 for name in commands}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def invoke(name):
+        ctx = FakeContext(random.choice(members))
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await handlers[name](ctx, **COMMANDS[name])
+            except Exception:
+                errors[name] += 1
+            if ctx.rejected:
+                rejections[name] += 1
+            else:
+                latencies[name].append(time.perf_counter() - start)
+
+    await asyncio.gather(*map(invoke, invocations))
+    return {
+        name: {
+            "requests": len(latencies[name]) + rejections[name],
+            "errors": errors[name],
+            "rejected": rejections[name],
+            "p50_ms": percentile(sorted(latencies[name]), 0.50) * 1000,
+            "p95_ms": percentile(sorted(latencies[name]), 0.95) * 1000,
+            "p99_ms": percentile(sorted(latencies[name]), 0.99) * 1000,
+        }
+        for name in commands
+    }
+
+
+async def run(args) -> dict:
+    server = FakeDMOJ(args.latency, args.jitter, args.page_size, args.error_rate)
+    dmoj_client.BASE_URL = await server.start()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            submission_store.SUBMISSIONS_FOLDER = folder  # start every run with an empty store
+            results = await run_load(args.commands, args.requests, args.concurrency, seed_members(args.members))
+    finally:
+        await dmoj_client.close()
+        await server.stop()
+    print(f"Fake DMOJ served {server.requests} requests ({server.errors} injected errors)")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the bot's commands against a local DMOJ stand-in")
+    parser.add_argument("--commands", type=lambda s: s.split(","), default=list(COMMANDS),
+                        help="comma separated commands to invoke (default: all)")
+    parser.add_argument("--requests", type=int, default=50, help="invocations of each command")
+    parser.add_argument("--concurrency", type=int, default=8, help="invocations running at once")
+    parser.add_argument("--members", type=int, default=20, help="members with connected DMOJ accounts")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every DMOJ response")
+    parser.add_argument("--jitter", type=float, default=0.05, help="up to this many more seconds, at random")
+    parser.add_argument("--page-size", type=int, default=1000, help="submissions per page")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of DMOJ requests that fail")
+    parser.add_argument("--output", help="file to save the results to, as JSON")
+    args = parser.parse_args()
+    unknown = set(args.commands) - set(COMMANDS)
+    if unknown:
+        parser.error(f"unknown commands: {', '.join(sorted(unknown))}")
+
+    render_pool.warm_up()  # before any thread is started
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        render_pool.shutdown()
+
+    print(f"{'command':30} {'requests':>8} {'errors':>6} {'rejected':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in results.items():
+        print(f"{name:30} {stats['requests']:8} {stats['errors']:6} {stats['rejected']:8} "
+              f"{stats['p50_ms']:9.1f} {stats['p95_ms']:9.1f} {stats['p99_ms']:9.1f}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Times the bot's hot paths on the repository's fixtures, without any network or Discord connection.
+Run from the repository root with `python -m benchmarks.suite`.
+
+Results are printed as a table and saved as JSON (`--output`), so they can be compared to an earlier run:
+    python -m benchmarks.suite --output benchmarks/before.json
+    python -m benchmarks.suite --compare benchmarks/before.json
+Comparing exits with status 1 if any benchmark got slower than `--threshold`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+
+import dmoj
+import leaderboard
+import rank_index
+import render_pool
+import user_cache
+from banner import make_banner
+from benchmarks.fakes import FakeBot, FakeUser
+from dmoj_utils import balance, balance_full_acs
+from points_plotter import build_histories, HISTORIES, plot_points
+from problem_catalog import CATEGORIES, get_catalog
+from problem_types_plotter import draw_radar
+from submission_store import Submission
+from user_data import UserData
+
+FIXTURE_PATH = "dummy_submissions.json"
+OUTPUT_PATH = "benchmarks/results.json"
+LEADERBOARD_USERS = 30
+DEFAULT_THRESHOLD = 0.2  # a benchmark regressed if its median got this much slower
+
+
+def fixture_submissions() -> list[Submission]:
+    with open(FIXTURE_PATH, "r") as dummy_data:
+        data = json.load(dummy_data)
+    return [
+        Submission(
+            id=sub["id"],
+            problem=sub["problem"],
+            date=sub["date"].split("T")[0],
+            points=sub["points"] if sub["points"] not in (None, "None") else 0,
+            result=sub["result"]
+        )
+        for sub in data["data"]["objects"]
+    ]
+
+
+def _stats(times: list[float]) -> dict:
+    times = sorted(t * 1000 for t in times)
+    return {
+        "iterations": len(times),
+        "mean_ms": statistics.fmean(times),
+        "min_ms": times[0],
+        "p50_ms": times[len(times) // 2],
+        "p95_ms": times[min(int(len(times) * 0.95), len(times) - 1)],
+    }
+
+
+def measure(func, iterations: int) -> dict:
+    func()  # the first call loads fonts, images and caches
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return _stats(times)
+
+
+async def measure_async(func, iterations: int) -> dict:
+    await func()
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func()
+        times.append(time.perf_counter() - start)
+    return _stats(times)
+
+
+def bench_sync(submissions: list[Submission]) -> dict:
+    results = {}
+
+    best = {}
+    ac = set()
+    for sub in submissions:
+        best[sub.problem] = max(best.get(sub.problem, 0), sub.points)
+        if sub.result == "AC":
+            ac.add(sub.problem)
+    full_acs = [best[p] for p in ac]
+    results["balance"] = measure(lambda: balance(best, ac), 2000)
+    results["balance_full_acs"] = measure(lambda: balance_full_acs(full_acs), 2000)
+
+    for kind in HISTORIES:
+        results[f"history_{kind}"] = measure(lambda: build_histories(submissions, [kind]), 50)
+    results["history_all"] = measure(lambda: build_histories(submissions), 50)
+
+    history = build_histories(submissions, ["points"])["points"]
+    results["plot_points"] = measure(lambda: plot_points(history, "someone", "Points", "Points Progression"), 20)
+
+    catalog = get_catalog()
+    solved = list(ac)
+    users = ["someone", "someone_else"]
+
+    def radar_types():
+        totals = catalog.type_totals(solved)
+        data = [[totals[c] for c in CATEGORIES]] * len(users)
+        return draw_radar(users, data)
+
+    def radar_weighted():
+        points = catalog.category_points(solved)
+        data = [[balance_full_acs(points[c]) for c in CATEGORIES]] * len(users)
+        return draw_radar(users, data)
+
+    results["radar_types"] = measure(radar_types, 20)
+    results["radar_weighted"] = measure(radar_weighted, 20)
+    return results
+
+
+async def bench_async() -> dict:
+    """
+    Times the banner and leaderboard commands end to end, including the render pool,
+    with every user and avatar already in the caches as they would be on a running bot.
+    """
+    results = {}
+    users = [FakeUser(i, f"member_{i}") for i in range(1, LEADERBOARD_USERS + 1)]
+    for i, user in enumerate(users):
+        user_cache.put(UserData(user_id=user.id, dmoj_username=user.name, level=50 - i, experience=100_000 - i * 1000,
+                                messages=i, next_experience_gain_time=0))
+        dmoj._points[user.name] = time.time(), 100 + i  # fresh, so no request is made
+    rank_index._loaded = True  # every user was added through user_cache above; there is no database
+    bot = FakeBot(users)
+
+    results["make_banner"] = await measure_async(lambda: make_banner(users[0]), 50)
+
+    async def cold_leaderboard():
+        leaderboard._tiles.clear()
+        leaderboard._last_leaderboard = None
+        await leaderboard.make_leaderboard(bot)
+
+    results["make_leaderboard"] = await measure_async(cold_leaderboard, 30)
+
+    page = 0
+
+    async def leaderboard_pages():  # the rows of each page are cached, but not the whole leaderboard
+        nonlocal page
+        page = (page + 1) % (LEADERBOARD_USERS // 10)
+        await leaderboard.make_leaderboard(bot, page * 10 + 1)
+
+    results["make_leaderboard_cached_rows"] = await measure_async(leaderboard_pages, 30)
+    results["make_leaderboard_unchanged"] = await measure_async(lambda: leaderboard.make_leaderboard(bot), 100)
+    return results
+
+
+def report(results: dict, baseline: dict | None, threshold: float) -> bool:
+    """
+    Prints the median of each benchmark, and how it changed since the baseline if there is one.
+    Returns whether any of them regressed.
+    """
+    regressed = False
+    for name, stats in results.items():
+        line = f"{name:32} {stats['p50_ms']:10.3f} ms"
+        old = baseline["benchmarks"].get(name) if baseline else None
+        if old is not None:
+            change = stats["p50_ms"] / old["p50_ms"] - 1
+            line += f"  {change:+7.1%}"
+            if change > threshold:
+                line += "  REGRESSION"
+                regressed = True
+        print(line)
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the bot's hot paths")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="file to save the results to (default: %(default)s)")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown of the median that counts as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    render_pool.warm_up()  # before any thread is started
+    try:
+        results = bench_sync(fixture_submissions())
+        results.update(asyncio.run(bench_async()))
+    finally:
+        render_pool.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+
+    with open(args.output, "w") as file:
+        json.dump({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "benchmarks": results,
+        }, file, indent=2)
+
+    regressed = report(results, baseline, args.threshold)
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,4 @@
 from PIL import ImageDraw, ImageOps, Image
-import requests
 from io import BytesIO
 
 BLACK = (0, 0, 0)
@@ -12,18 +11,10 @@ YELLOW = (255, 200, 0)
 FONT_PATH = "assets/consola.ttf"
 
 
-def request_image(url: str):
+def crop_circle(src):
     """
-    Fetches an image from the given URL.
-    """
-    response = requests.get(url)
-    image = Image.open(BytesIO(response.content))
-    return image
-
-
-def crop_circle(src, dest, position) -> None:
-    """
-    Crops the source image into a circle and draws it onto the destination image.
+    Crops the source image into a circle.
+    Returns an image that is transparent outside of the circle.
     """
     # Create a circular mask
     mask = Image.new("L", src.size, 0)
@@ -32,17 +23,24 @@ def crop_circle(src, dest, position) -> None:
     # Crop the source image using the mask
     output = ImageOps.fit(src, mask.size, centering=(0.5, 0.5))
     output.putalpha(mask)
-    # Draw it to the destination image
-    dest.paste(output, position, output)
+    return output
+
+
+def draw_avatar(avatar, dest_image, position) -> None:
+    """
+    Draws an avatar, already cropped by `crop_circle`, onto the destination image at the given position.
+    """
+    dest_image.paste(avatar, position, avatar)
 
 
-def draw_user_avatar(user, dest_image, size: int, position) -> None:
+def image_to_buffer(image) -> BytesIO:
     """
-    Draws the avatar of the given user onto the destination image at the given position.
+    Saves an image as a PNG into an in-memory buffer, ready to be sent with `discord.File`.
     """
-    avatar_image = request_image(user.display_avatar.url)
-    avatar_image = avatar_image.resize((size, size))
-    crop_circle(avatar_image, dest_image, position)
+    buffer = BytesIO()
+    image.save(buffer, "PNG", compress_level=3)  # much faster to encode than the default, barely bigger
+    buffer.seek(0)
+    return buffer
 
 
 def text_shadow(draw, position, text: str, font, fore=WHITE, back=BLACK, offset=3,
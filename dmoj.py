@@ -1,19 +1,36 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import time
 from typing import Union
 
-from user_data import UserData, get_user_data
+import aiohttp
+
+import metrics
+import user_cache
+from user_data import UserData
+from dmoj_client import fetch_json
+from problem_catalog import resolve
 
 # change to your own key if needed
-user_base = "https://dmoj.ca/api/v2/user/"
+user_base = "/api/v2/user/"
+
+# problems in the CCC and CCO groups; the catalog has no groups, but their codes all start with these
+POINT_PREFIXES = ("ccc", "cco")
+POINTS_TTL = 10 * 60  # seconds before a user's points are refreshed in the background
+POINTS_MAX_AGE = 24 * 60 * 60  # seconds before cached points are too old to be shown at all
+
+_points_hits = metrics.CACHE_REQUESTS.labels("points", "hit")
+_points_stale = metrics.CACHE_REQUESTS.labels("points", "stale")  # returned, but refreshed in the background
+_points_misses = metrics.CACHE_REQUESTS.labels("points", "miss")
+
+_points = {}  # DMOJ username: (time when computed, points)
+_refreshing = {}  # DMOJ username: task computing the user's points
 
 
-def fetch_ccc(user: str, api_key: str):
-    """dead function since no one will bother sending their API key every time, just use the web scraper below"""
+async def fetch_ccc(user: str, api_key: str):
+    """dead function since no one will bother sending their API key every time, just use fetch_points below"""
     url = user_base + user
     headers = {"Authorization": f"Bearer {api_key}"}
-    response = requests.get(url, headers)
-    data = response.json()
+    data = await fetch_json(url, headers=headers)
 
     problems = data["data"]["object"]["solved_problems"]
     ccc = [p for p in problems if p.startswith("ccc")]
@@ -21,33 +38,71 @@ def fetch_ccc(user: str, api_key: str):
     return len(ccc), ccc
 
 
-def fetch_points(dmoj_username: str) -> int:
+async def _compute_points(dmoj_username: str) -> int:
+    try:
+        data = await fetch_json(user_base + dmoj_username)
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:  # misspelled, renamed or deleted account
+            return 0
+        raise
+    problems = data["data"]["object"]["solved_problems"]
+    contest_problems = [p for p in problems if p.startswith(POINT_PREFIXES)]
+    catalog = await resolve(contest_problems)
+    return catalog.total_points(contest_problems)
+
+
+async def _refresh_points(dmoj_username: str) -> int:
+    # share a single computation between everyone asking for the same user
+    if dmoj_username not in _refreshing:
+        _refreshing[dmoj_username] = asyncio.ensure_future(_compute_points(dmoj_username))
+        _refreshing[dmoj_username].add_done_callback(lambda _: _refreshing.pop(dmoj_username, None))
+    # the computation keeps going for the others waiting on it even if this caller is cancelled
+    points = await asyncio.shield(_refreshing[dmoj_username])
+    _points[dmoj_username] = time.time(), points
+    return points
+
+
+def _refresh_in_background(dmoj_username: str) -> None:
+    async def refresh():
+        try:
+            await _refresh_points(dmoj_username)
+        except Exception as e:
+            print(f"Failed to refresh the points of {dmoj_username}: " + str(e))
+
+    if dmoj_username not in _refreshing:
+        asyncio.ensure_future(refresh())
+
+
+async def fetch_points(dmoj_username: str) -> int:
     """
     Returns how many CCC/CCO points a DMOJ user has.
+    Points older than `POINTS_TTL` are returned right away and refreshed in the background.
+    If DMOJ can't be reached, returns the last known points, or 0 if there are none.
     """
-    url = f"https://dmoj.ca/user/{dmoj_username}/solved"
-    response = requests.get(url)
-    html = response.text
-    soup = BeautifulSoup(html, 'html.parser')
-
-    valid_groups = ["CCC", "CCO"]
+    cached = _points.get(dmoj_username)
+    if cached is None or time.time() - cached[0] >= POINTS_MAX_AGE:
+        _points_misses.inc()
+        try:
+            return await _refresh_points(dmoj_username)
+        except Exception as e:
+            print(f"Failed to fetch the points of {dmoj_username}: " + str(e))
+            return cached[1] if cached is not None else 0
 
-    groups = soup.find_all(class_='unselectable toggle closed')
-    total = 0
-    for group in groups:
-        s = group.text.replace("(", "").split()
-        if s[0] in valid_groups:
-            total += int(round(float(s[1]), 0))
-    return total
+    if time.time() - cached[0] >= POINTS_TTL:
+        _points_stale.inc()
+        _refresh_in_background(dmoj_username)
+    else:
+        _points_hits.inc()
+    return cached[1]
 
 
-def connect_account(user_id: int, dmoj_username: str) -> None:
+async def connect_account(user_id: int, dmoj_username: str) -> None:
     """
     Connects a Discord account to a DMOJ account.
     """
     dmoj_username = dmoj_username.replace(" ", "_")
     
-    user_data = get_user_data(user_id)
+    user_data = await user_cache.get_user(user_id)
     if user_data is not None:
         user_data.dmoj_username = dmoj_username
     else:
@@ -60,4 +115,5 @@ def connect_account(user_id: int, dmoj_username: str) -> None:
             next_experience_gain_time=0
         )
     
-    user_data.save_to_db()
+    await user_data.save_to_db()
+    user_cache.put(user_data)
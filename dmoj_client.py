@@ -0,0 +1,259 @@
+"""
+Shared async client for everything fetched from DMOJ.
+All requests go through a single aiohttp session so connections are kept alive and reused.
+
+Responses are cached for a time that depends on the endpoint (see `CACHE_TTLS`),
+identical requests made at the same time share a single download,
+and expired responses are revalidated with `ETag`/`Last-Modified` when DMOJ sends them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+import aiohttp
+import ijson
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv("environment/.env")  # load all the variables from the env file
+api_key = os.getenv("DMOJ_PASSWORD")
+
+BASE_URL = os.getenv("DMOJ_BASE_URL", "https://dmoj.ca")  # can point to a stand-in server for testing
+MAX_CONNECTIONS = 10  # size of the keep-alive connection pool
+MAX_CONCURRENT_PAGES = 4  # submission pages fetched ahead of the one being read, for one user
+TIMEOUT = aiohttp.ClientTimeout(total=60)
+
+# seconds responses are cached for, by path prefix; the first matching prefix is used
+CACHE_TTLS = [
+    ("/api/v2/submissions", 30),  # only the last page is cached, see `_should_cache`
+    ("/api/v2/user/", 5 * 60),
+    ("/api/v2/problem/", 60 * 60),
+    ("/user/", 5 * 60),
+    ("/problems/", 0),  # only crawled by the catalog refresh, which wants fresh pages
+]
+DEFAULT_TTL = 60
+MAX_CACHED = 256  # cached responses kept before the least recently used are dropped
+SUBMISSION_FIELDS = ("id", "problem", "date", "points", "result")  # the only submission fields we keep
+
+_cache_hits = metrics.CACHE_REQUESTS.labels("dmoj", "hit")
+_cache_coalesced = metrics.CACHE_REQUESTS.labels("dmoj", "coalesced")  # joined a download already in flight
+_cache_misses = metrics.CACHE_REQUESTS.labels("dmoj", "miss")
+
+_session = None
+_cache = OrderedDict()  # (format, path, params): _CachedResponse, least recently used first
+_in_flight = {}  # (format, path, params): task downloading that response
+
+
+@dataclass
+class _CachedResponse:
+    value: dict | str | tuple
+    expires: float
+    etag: str | None
+    last_modified: str | None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Returns the shared session, creating it on first use.
+    Must be called from inside the event loop.
+    """
+    global _session
+    if _session is None or _session.closed:
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else None
+        connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=60)
+        _session = aiohttp.ClientSession(BASE_URL, connector=connector, headers=headers, timeout=TIMEOUT)
+    return _session
+
+
+def _endpoint(path: str) -> str:
+    """
+    The endpoint a path belongs to, used to label metrics without a label for every user and problem.
+    """
+    return next((prefix for prefix, _ in CACHE_TTLS if path.startswith(prefix)), "other")
+
+
+@asynccontextmanager
+async def _get(path: str, params: dict = None, headers: dict = None):
+    """
+    Sends a GET request with the shared session, recording its status and how long it took.
+    """
+    endpoint = _endpoint(path)
+    status = "error"  # no response at all
+    start = time.perf_counter()
+    try:
+        async with get_session().get(path, params=params, headers=headers) as response:
+            status = str(response.status)
+            yield response
+    finally:
+        metrics.DMOJ_REQUESTS.labels(endpoint, status).inc()
+        metrics.DMOJ_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+
+
+async def close() -> None:
+    """
+    Closes the shared session. Called when the bot shuts down.
+    """
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def _ttl(path: str) -> float:
+    return next((ttl for prefix, ttl in CACHE_TTLS if path.startswith(prefix)), DEFAULT_TTL)
+
+
+async def _parse_submissions(response: aiohttp.ClientResponse) -> tuple[list[tuple], int]:
+    """
+    Parses a page of /api/v2/submissions while it is being downloaded, without building the whole JSON.
+    Returns the submissions as tuples of `SUBMISSION_FIELDS`, and the number of pages.
+    """
+    submissions = []
+    total_pages = 0
+    submission = None
+    async for prefix, event, value in ijson.parse_async(response.content, use_float=True):
+        if prefix == "data.objects.item":
+            if event == "start_map":
+                submission = dict.fromkeys(SUBMISSION_FIELDS)
+            elif event == "end_map":
+                submissions.append(tuple(submission.values()))
+                submission = None
+        elif submission is not None:
+            field = prefix[len("data.objects.item."):]
+            if field in submission:
+                submission[field] = value
+        elif prefix == "data.total_pages":  # comes after the submissions
+            total_pages = value
+    return submissions, total_pages
+
+
+_PARSERS = {
+    "json": aiohttp.ClientResponse.json,
+    "text": aiohttp.ClientResponse.text,
+    "submissions": _parse_submissions,
+}
+
+
+def _should_cache(key: tuple, value) -> bool:
+    if key[0] == "submissions":
+        # the store keeps every full page, so only the last one is requested again (by the next sync)
+        _, total_pages = value
+        return dict(key[2]).get("page") == total_pages
+    return True
+
+
+async def _download(key: tuple, path: str, params: dict | None, ttl: float):
+    """
+    Downloads a response and caches it, or only renews the cached one if DMOJ says it didn't change.
+    """
+    response_format = key[0]
+    cached = _cache.get(key)
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    async with _get(path, params, headers) as response:
+        if response.status == 304 and cached is not None:
+            cached.expires = time.monotonic() + ttl
+            _cache.move_to_end(key)
+            return cached.value
+
+        response.raise_for_status()
+        value = await _PARSERS[response_format](response)
+        if ttl <= 0 or not _should_cache(key, value):
+            _cache.pop(key, None)
+            return value
+        _cache[key] = _CachedResponse(
+            value=value,
+            expires=time.monotonic() + ttl,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+    _cache.move_to_end(key)
+    while len(_cache) > MAX_CACHED:
+        _cache.popitem(last=False)
+    return value
+
+
+async def _fetch(response_format: str, path: str, params: dict | None):
+    ttl = _ttl(path)
+    key = (response_format, path, tuple(sorted((params or {}).items())))
+    if ttl <= 0:
+        return await _download(key, path, params, ttl)
+
+    cached = _cache.get(key)
+    if cached is not None and time.monotonic() < cached.expires:
+        _cache_hits.inc()
+        _cache.move_to_end(key)
+        return cached.value
+
+    # share a single download between everyone asking for the same response
+    if key not in _in_flight:
+        _cache_misses.inc()
+        _in_flight[key] = asyncio.ensure_future(_download(key, path, params, ttl))
+        _in_flight[key].add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        _cache_coalesced.inc()
+    # the download keeps going for the others waiting on it even if this caller is cancelled
+    return await asyncio.shield(_in_flight[key])
+
+
+async def fetch_json(path: str, params: dict = None, headers: dict = None) -> dict:
+    """
+    Returns a JSON response from DMOJ, cached. The returned object is shared, so it must not be changed.
+    Requests with extra headers aren't cached.
+    """
+    if headers:
+        async with _get(path, params, headers) as response:
+            response.raise_for_status()
+            return await response.json()
+    return await _fetch("json", path, params)
+
+
+async def fetch_text(path: str, params: dict = None) -> str:
+    """
+    Returns a text response from DMOJ, cached.
+    """
+    return await _fetch("text", path, params)
+
+
+async def fetch_submission(user: str, page: int) -> tuple[list[tuple], int]:
+    """
+    Returns a page of a user's submissions as tuples of `SUBMISSION_FIELDS`, and the number of pages.
+    """
+    return await _fetch("submissions", "/api/v2/submissions", {"user": user, "page": page})
+
+
+async def fetch_submission_pages(user: str, first_page: int = 1):
+    """
+    Yields the submissions of every page for a user, in order, starting at `first_page`.
+    Submissions are tuples of `SUBMISSION_FIELDS`.
+    The first page tells us how many pages there are; the rest are then fetched concurrently,
+    at most `MAX_CONCURRENT_PAGES` ahead of the page being read, so memory use doesn't grow with the history.
+    """
+    submissions, n_pages = await fetch_submission(user, first_page)
+    yield submissions
+
+    pages = iter(range(first_page + 1, n_pages + 1))
+    tasks = deque(asyncio.ensure_future(fetch_submission(user, page))
+                  for page in itertools.islice(pages, MAX_CONCURRENT_PAGES))
+    try:
+        while tasks:  # yield in order even though pages may finish out of order
+            submissions, _ = await tasks.popleft()
+            for page in itertools.islice(pages, 1):  # keep the window full while the caller reads this page
+                tasks.append(asyncio.ensure_future(fetch_submission(user, page)))
+            yield submissions
+    finally:
+        for task in tasks:  # stop fetching if the caller gives up early
+            task.cancel()
@@ -1,3 +1,9 @@
+from bisect import bisect_left, insort
+
+MAX_COUNTED = 100  # only the best 100 problems are counted
+WEIGHTS = [0.95 ** i for i in range(MAX_COUNTED)]
+
+
 def balance(questions, ac):
     """applies formula to points based on question values"""
     bal = sorted(questions.values(), reverse=True)  # sort by point worth
@@ -13,3 +19,49 @@ def balance_full_acs(questions):
     bal = sorted(questions, reverse=True)  # sort by point worth
     P = sum((0.95 ** i) * bal[i] for i in range(0, min(100, len(bal))))
     return P
+
+
+class Balancer:
+    """
+    Keeps `balance(best, ac)` up to date as new best scores arrive.
+
+    Point values are kept in a sorted list, so an update only costs a binary search
+    and the weighted sum is only recomputed when the top 100 actually changes.
+    The sum is taken in the same order as `balance`, so the values are identical.
+    """
+
+    def __init__(self, ac=None):
+        self.best = {}  # best points for each question
+        self.ac = set() if ac is None else ac  # may be shared between several balancers
+        self._values = []  # every best score, ascending
+        self._top_sum = 0
+
+    def improves(self, problem, points) -> bool:
+        """whether `points` would be a new best for `problem`"""
+        return problem not in self.best or self.best[problem] < points
+
+    def update(self, problem, points, accepted=False) -> float:
+        """records a new best score for a problem and returns the new balanced points"""
+        values = self._values
+        cutoff = len(values) - MAX_COUNTED  # values at or above this index are counted
+        changed = False
+
+        old = self.best.get(problem)
+        if old is not None:
+            i = bisect_left(values, old)
+            del values[i]
+            changed = i >= cutoff
+
+        self.best[problem] = points
+        insort(values, points)
+        if changed or bisect_left(values, points) >= len(values) - MAX_COUNTED:
+            top = values[-1:-MAX_COUNTED - 1:-1]  # best values first
+            self._top_sum = sum(WEIGHTS[i] * top[i] for i in range(len(top)))
+
+        if accepted:
+            self.ac.add(problem)
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self._top_sum + 150 * (1 - 0.997 ** len(self.ac))
@@ -0,0 +1,152 @@
+"""
+Scheduler for the expensive commands (plots, banners and leaderboards).
+
+Each class of job has a limit on how many of its jobs run at once; the rest wait in order.
+A job that is started again while it is still queued or running (like a repeated click)
+joins the existing job instead of starting a new one.
+New jobs are rejected when their queue is full, or when the user already has too many jobs of that class.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+import metrics
+
+# job class: how many of its jobs can run at once
+CONCURRENCY = {
+    "plot": 4,  # DMOJ requests and charts
+    "banner": 4,
+    "leaderboard": 2,  # shares the database pool (5 connections) with every message
+}
+MAX_WAITING = 20  # jobs of a class that can wait for a slot before new ones are rejected
+MAX_JOBS_PER_USER = 2  # jobs of a class that one user can have queued or running at once
+
+
+class JobRejected(Exception):
+    """
+    Raised when a new job can't be queued. The message can be shown to the user.
+    """
+
+
+@dataclass
+class _JobClass:
+    name: str
+    concurrency: int
+    running: int = 0
+    waiting: deque = field(default_factory=deque)  # (job key, future set when the job can start), in order
+    jobs_per_user: Counter = field(default_factory=Counter)  # user: number of their jobs queued or running
+
+
+_classes = {name: _JobClass(name, concurrency) for name, concurrency in CONCURRENCY.items()}
+_jobs = {}  # job key: task running the job
+
+
+def _position(job_class: _JobClass, key) -> int | None:
+    """
+    Returns the position of a job in its queue, starting at 1, or `None` if it isn't waiting.
+    """
+    for i, (waiting_key, _) in enumerate(job_class.waiting):
+        if waiting_key == key:
+            return i + 1
+    return None
+
+
+def _release(job_class: _JobClass) -> None:
+    # hand the slot straight to the next job, so it can't be taken by a job that arrives later
+    while job_class.waiting:
+        _, ready = job_class.waiting.popleft()
+        if not ready.done():
+            ready.set_result(None)
+            return
+    job_class.running -= 1
+
+
+async def _notify(on_queued, position: int) -> None:
+    try:
+        await on_queued(position)
+    except Exception as e:
+        print("Failed to report queue position: " + str(e))
+
+
+def _enqueue(job_class: _JobClass, key) -> asyncio.Future | None:
+    """
+    Takes a free slot for a new job, or puts the job at the end of the queue.
+    Returns `None` if the job can start right away, or a future set once it can.
+    """
+    if job_class.running < job_class.concurrency and not job_class.waiting:
+        job_class.running += 1
+        return None
+    ready = asyncio.get_running_loop().create_future()
+    job_class.waiting.append((key, ready))
+    return ready
+
+
+async def _run(job_class: _JobClass, key, ready, func, on_queued):
+    queued_at = time.perf_counter()
+    if ready is not None:
+        metrics.JOBS_WAITING.labels(job_class.name).inc()
+        try:
+            position = _position(job_class, key)
+            if on_queued is not None and position is not None:
+                await _notify(on_queued, position)
+            await ready
+        except asyncio.CancelledError:
+            if ready.done() and not ready.cancelled():  # we were given a slot, pass it on
+                _release(job_class)
+            ready.cancel()
+            raise
+        finally:
+            metrics.JOBS_WAITING.labels(job_class.name).dec()
+    metrics.JOB_QUEUE_WAIT.labels(job_class.name).observe(time.perf_counter() - queued_at)
+
+    try:
+        return await func()
+    finally:
+        _release(job_class)
+
+
+def _check_limits(job_class: _JobClass, user) -> None:
+    if job_class.jobs_per_user[user] >= MAX_JOBS_PER_USER:
+        metrics.JOBS_REJECTED.labels(job_class.name, "user_limit").inc()
+        raise JobRejected(f"You already have {MAX_JOBS_PER_USER} requests like this in progress. "
+                          f"Please wait for them to finish before sending another one.")
+    if len(job_class.waiting) >= MAX_WAITING:
+        metrics.JOBS_REJECTED.labels(job_class.name, "queue_full").inc()
+        raise JobRejected("The bot is busy with too many requests right now. Please try again in a minute.")
+
+
+def _job_done(job_class: _JobClass, key, user) -> None:
+    _jobs.pop(key, None)
+    job_class.jobs_per_user[user] -= 1
+    if job_class.jobs_per_user[user] <= 0:
+        del job_class.jobs_per_user[user]
+
+
+async def run(class_name: str, key, func, on_queued=None, user=None):
+    """
+    Runs `await func()` as a job of the given class, once one of the class's slots is free, and returns its result.
+    If a job with the same `key` is queued or running, waits for that job's result instead.
+    The result is shared between everyone who joined the job, so it must not be changed.
+    `await on_queued(position)` is called if the job has to wait, with its position in the queue.
+    Raises `JobRejected` if the class's queue is full or `user` already has `MAX_JOBS_PER_USER` jobs of the class.
+    """
+    job_class = _classes[class_name]
+    job = _jobs.get(key)
+    if job is not None:
+        metrics.JOBS_JOINED.labels(class_name).inc()
+        position = _position(job_class, key)
+        if position is not None and on_queued is not None:
+            await _notify(on_queued, position)
+    else:
+        _check_limits(job_class, user)
+        ready = _enqueue(job_class, key)
+        job = asyncio.ensure_future(_run(job_class, key, ready, func, on_queued))
+        _jobs[key] = job
+        job_class.jobs_per_user[user] += 1
+        job.add_done_callback(lambda _: _job_done(job_class, key, user))
+    # the job keeps running for the others who joined it even if this caller gives up
+    return await asyncio.shield(job)
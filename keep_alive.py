@@ -1,4 +1,5 @@
-from flask import Flask
+from flask import Flask, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from threading import Thread
 
 app = Flask("")
@@ -9,6 +10,11 @@ def main():
     return "Your bot is alive!"
 
 
+@app.route("/metrics")
+def metrics():
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
 def run():
     app.run(host="0.0.0.0", port=8080)
 
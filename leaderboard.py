@@ -1,54 +1,160 @@
-from PIL import ImageDraw, ImageFont, ImageOps, Image
-import requests
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
 from io import BytesIO
-import os
 
-from user_data import UserData, get_top_users
+from PIL import ImageDraw, ImageFont, ImageOps, Image
+
+import avatar_cache
+import metrics
+import rank_index
+import render_pool
+import user_cache
 
 from common import (
     BLACK, WHITE, GREEN, BLUE, ORANGE, YELLOW,
     FONT_PATH,
-    draw_user_avatar, text_shadow
+    draw_avatar, image_to_buffer, text_shadow
 )
 
 font_leaderboard = ImageFont.truetype(FONT_PATH, 55)
 font_username = ImageFont.truetype(FONT_PATH, 38)
 
 
-def make_leaderboard(bot) -> str:
+IMG_WIDTH = 800
+ROW_WIDTH, ROW_HEIGHT = IMG_WIDTH - 50, 75
+MAX_TILES = 100  # rendered rows kept in memory
+
+_tile_hits = metrics.CACHE_REQUESTS.labels("leaderboard_row", "hit")
+_tile_misses = metrics.CACHE_REQUESTS.labels("leaderboard_row", "miss")
+
+_tiles = OrderedDict()  # row key: rendered row, least recently used first
+_last_leaderboard = None  # (row keys, PNG data) of the last generated leaderboard
+
+
+@dataclass
+class LeaderboardRow:
+    """
+    A single user's row in the leaderboard. Sent to the render pool, so it must be picklable.
     """
-    Generates the current server-wide leaderboard.
-    Returns the filename of the generated leaderboard.
+    user_id: int
+    position: int
+    name: str | None
+    level: int
+    avatar_key: str | None
     """
-    top_users = get_top_users()
+    Hash of the user's avatar, used to tell whether the avatar changed.
+    """
+    avatar: Image.Image | None = None
 
-    img_size = img_width, img_height = 800, 1110
-    img = Image.new("RGB", img_size, BLUE)
-    draw = ImageDraw.Draw(img)
+    @property
+    def key(self) -> tuple:
+        """
+        Everything that changes how the row looks.
+        """
+        return self.user_id, self.position, self.level, self.name, self.avatar_key
 
-    text_shadow(draw, (img_width // 2, 55), "Leaderboard", font_leaderboard, anchor="mm")
 
-    for i, user_data in enumerate(top_users):
-        bounding_box = (25, i * 100 + 110, img_width - 25, i * 100 + 185)
-        draw.rounded_rectangle(bounding_box, 15, GREEN)
+async def make_leaderboard(bot, first_rank: int = 1, count: int = 10) -> BytesIO:
+    """
+    Generates the server-wide leaderboard, showing `count` users starting from rank `first_rank`.
+    Only the rows that changed since they were last drawn are rendered again.
+    Returns the generated leaderboard as an in-memory PNG.
+    """
+    global _last_leaderboard
+    await rank_index.ensure_loaded()
+    user_ids = rank_index.users_in_range(first_rank, count)
+    users_data = await asyncio.gather(*map(user_cache.get_user, user_ids))
 
-        # Draw the user's avatar
-        user = bot.get_user(user_data.user_id)
-        if user:
-            draw_user_avatar(user, img, 55, (35, i * 100 + 120))
+    users = [bot.get_user(user_id) for user_id in user_ids]
+    rows = [
+        LeaderboardRow(
+            user_id=user_id,
+            position=first_rank + i,
+            name=user.name if user else None,
+            level=user_data.level if user_data else 0,
+            avatar_key=user.display_avatar.key if user else None
+        )
+        for i, (user_id, user, user_data) in enumerate(zip(user_ids, users, users_data))
+    ]
+    keys = [row.key for row in rows]
+    if _last_leaderboard is not None and _last_leaderboard[0] == keys:  # nothing changed
+        return BytesIO(_last_leaderboard[1])
 
-        # Write the user's position in the leaderboard
-        position = f"{i + 1}. "
-        if i <= 2:
-            text_shadow(draw, (105, i * 100 + 148), position, font_username, fore=YELLOW, back=BLACK, anchor="lm")
+    tiles = [_tiles.get(key) for key in keys]
+    for key, tile in zip(keys, tiles):
+        if tile is not None:
+            _tiles.move_to_end(key)
+            _tile_hits.inc()
         else:
-            draw.text((105, i * 100 + 148), position, BLACK, font_username, anchor="lm")
+            _tile_misses.inc()
+
+    # only the rows that will be drawn need an avatar
+    missing = [i for i, tile in enumerate(tiles) if tile is None]
+    avatars = await avatar_cache.get_avatars([users[i] for i in missing], 55)
+    for i, avatar in zip(missing, avatars):
+        rows[i].avatar = avatar
+
+    tiles, buffer = await render_pool.run(render_leaderboard, rows, tiles)
+
+    for i in missing:
+        _tiles[keys[i]] = tiles[i]
+    while len(_tiles) > MAX_TILES:
+        _tiles.popitem(last=False)
+    _last_leaderboard = keys, buffer.getvalue()
+    return buffer
+
+
+@lru_cache
+def _base_image(n_rows: int):
+    """
+    The leaderboard without any rows, with room for `n_rows` rows.
+    """
+    img = Image.new("RGB", (IMG_WIDTH, n_rows * 100 + 110), BLUE)
+    draw = ImageDraw.Draw(img)
+    text_shadow(draw, (IMG_WIDTH // 2, 55), "Leaderboard", font_leaderboard, anchor="mm")
+    return img
+
+
+def render_row(row: LeaderboardRow):
+    """
+    Draws a single row of the leaderboard, including the background around its rounded corners.
+    """
+    tile = Image.new("RGB", (ROW_WIDTH + 1, ROW_HEIGHT + 1), BLUE)  # the rectangle includes its end points
+    draw = ImageDraw.Draw(tile)
+    draw.rounded_rectangle(((0, 0), (ROW_WIDTH, ROW_HEIGHT)), 15, GREEN)
+
+    # Draw the user's avatar
+    if row.avatar:
+        draw_avatar(row.avatar, tile, (10, 10))
+
+    # Write the user's position in the leaderboard
+    position = f"{row.position}. "
+    if row.position <= 3:
+        text_shadow(draw, (80, 38), position, font_username, fore=YELLOW, back=BLACK, anchor="lm")
+    else:
+        draw.text((80, 38), position, BLACK, font_username, anchor="lm")
+
+    # Write the user's name
+    username = " " * len(position)
+    username += row.name if row.name else "[unknown user]"
+    draw.text((80, 38), username, BLACK, font_username, anchor="lm")
+    draw.text((ROW_WIDTH - 10, 38), f"Level {row.level}", BLACK, font_username, anchor="rm")
+    return tile
+
+
+def render_leaderboard(rows: list[LeaderboardRow], tiles: list) -> tuple[list, BytesIO]:
+    """
+    Draws the leaderboard. Runs in the render pool.
+    `tiles` holds the already rendered rows, or `None` for the rows that must be rendered.
+    Returns every rendered row and the generated leaderboard as an in-memory PNG.
+    """
+    tiles = [tile if tile is not None else render_row(row) for row, tile in zip(rows, tiles)]
 
-        # Write the user's name
-        username = " " * len(position)
-        username += user.name if user else "[unknown user]"
-        draw.text((105, i * 100 + 148), username, BLACK, font_username, anchor="lm")
-        draw.text((img_width - 35, i * 100 + 148), f"Level {user_data.level}", BLACK, font_username, anchor="rm")
+    img = _base_image(max(len(tiles), 1)).copy()
+    for i, tile in enumerate(tiles):
+        img.paste(tile, (25, i * 100 + 110))
 
-    img.save("assets/temp_leaderboard.png")
-    return "assets/temp_leaderboard.png"
+    return tiles, image_to_buffer(img)
@@ -2,23 +2,28 @@ import random
 import math
 import time
 
+import user_cache
 from dmoj import fetch_points
-from user_data import UserData, get_user_data
+from user_data import UserData
 
 # only messages and commands sent in this server count towards points
 BOT_SERVER_ID = 1151610487159672982
 
 
-def handle_message_sent(ctx, is_slash_command=True) -> None:
+async def handle_message_sent(ctx, is_slash_command=True) -> None:
     """
     Updates the experience and level of the user who sent a message or used a slash command.
     """
     if ctx.guild.id != BOT_SERVER_ID:
         return
-    user_data = get_user_data(ctx.author.id)
+    try:
+        user_data = await user_cache.get_user(ctx.author.id)
+    except Exception as e:
+        print("Failed to fetch user data from db: " + str(e))
+        return
     if user_data is not None:
         _handle_message_sent_user_data(ctx, user_data, is_slash_command)
-        user_data.save_to_db()
+        user_cache.mark_dirty(user_data)  # saved to the database in the next batch
 
 
 def _handle_message_sent_user_data(ctx, user_data: UserData, is_slash_command: bool) -> None:
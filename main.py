@@ -1,14 +1,23 @@
 import discord
 
 import os
+import time
+from io import BytesIO
 from dotenv import load_dotenv
 from typing import List
 
 import keep_alive
+import dmoj_client
+import jobs
+import metrics
+import problem_catalog
+import rank_index
+import render_pool
+import translate
+import user_cache
+import user_data as database
 
 # imports from other files
-from translate import translate_text
-from user_data import get_user_data
 from dmoj import connect_account
 from levels import handle_message_sent
 from banner import make_banner
@@ -19,11 +28,54 @@ from problem_types_plotter import plot_problem_types, plot_problem_types_weighte
 load_dotenv("environment/.env")  # load all the variables from the env file
 token = os.getenv("TOKEN")
 
-bot = discord.Bot(intents=discord.Intents.all())
+
+class CodingClubBot(discord.Bot):
+    async def invoke_application_command(self, ctx):
+        start = time.perf_counter()
+        try:
+            await super().invoke_application_command(ctx)
+        finally:
+            metrics.COMMAND_LATENCY.labels(ctx.command.qualified_name).observe(time.perf_counter() - start)
+
+    async def close(self):
+        await user_cache.stop()  # save every pending experience change
+        await database.close_pool()
+        await dmoj_client.close()
+        await translate.close()
+        render_pool.shutdown()
+        await super().close()
+
+
+bot = CodingClubBot(intents=discord.Intents.all())
+
+
+async def run_image_job(ctx, job_class: str, key: tuple, make_image, *args) -> BytesIO:
+    """
+    Generates an image with `await make_image(*args)` through the job scheduler.
+    Tells the user their place in the queue if the job has to wait,
+    and joins the user's identical request if it is already queued or running.
+    Raises `jobs.JobRejected` if the job can't be queued.
+    """
+    async def make():
+        return (await make_image(*args)).getvalue()  # every caller gets its own copy of the image
+
+    async def tell_position(position):
+        await ctx.respond(f"Your request is **#{position}** in the queue. It will be sent here once it's ready.")
+
+    data = await jobs.run(job_class, (ctx.author.id, *key), make, on_queued=tell_position, user=ctx.author.id)
+    return BytesIO(data)
+
+
+async def plot_history(fetch_history, dmoj_username: str, y_text: str, title: str) -> BytesIO:
+    history = await fetch_history(dmoj_username)
+    return await render_pool.run(plot_points, history, dmoj_username, y_text, title)
 
 
 @bot.event
 async def on_ready():
+    user_cache.start()
+    problem_catalog.start_refreshing()
+    await rank_index.ensure_loaded()
     print(f"{bot.user} is ready and online!")
     print('Servers:')
     for guild in bot.guilds:
@@ -32,7 +84,7 @@ async def on_ready():
 
 @bot.event
 async def on_application_command_completion(ctx):
-    handle_message_sent(ctx)
+    await handle_message_sent(ctx)
 
 
 @bot.event
@@ -40,7 +92,7 @@ async def on_message(message):
     if message.author.bot:
         return
 
-    handle_message_sent(message, is_slash_command=False)
+    await handle_message_sent(message, is_slash_command=False)
 
     if message.content.startswith(",translate"):
         cmd = message.content.split(" ", 1)
@@ -54,10 +106,10 @@ async def on_message(message):
             tl = lang[2]
         if message.reference:  # translate replied message
             original_message = await message.channel.fetch_message(message.reference.message_id)
-            translated_text = translate_text(original_message.content, sl, tl)
+            translated_text = await translate.translate_text(original_message.content, sl, tl)
             await message.reply(translated_text)
         elif len(cmd) > 1:
-            translated_text = translate_text(cmd[1], sl, tl)
+            translated_text = await translate.translate_text(cmd[1], sl, tl)
             await message.reply(translated_text)
 
 @bot.slash_command(name="hello", description="A test command to make sure bot is working")
@@ -129,7 +181,7 @@ async def ccc_points(ctx, user: discord.Option(discord.User, "Get the points of
                                                default=None)):
     try:
         user_id = (user.id if user else ctx.author.id)
-        user_data = get_user_data(user_id)
+        user_data = await user_cache.get_user(user_id)
         if user_data is None:
             if user:
                 await ctx.respond(
@@ -144,24 +196,48 @@ async def ccc_points(ctx, user: discord.Option(discord.User, "Get the points of
         if not user:
             user = bot.get_user(ctx.author.id)
 
-        filename = make_banner(user)
-        with open(filename, "rb") as file_pointer:
-            await ctx.followup.send(file=discord.File(file_pointer))
+        banner = await run_image_job(ctx, "banner", ("fetch_points", user.id), make_banner, user)
+        await ctx.followup.send(file=discord.File(banner, filename="banner.png"))
 
+    except jobs.JobRejected as e:
+        await ctx.respond(str(e))
     except:
         await ctx.respond("An error has occurred while fetching CCC points. Please alert an Executive.")
         raise
 
 
 @bot.slash_command(name="leaderboard", description="Get the server-wide leaderboard")
-async def leaderboard(ctx):
+async def leaderboard(ctx, page: discord.Option(int, "Page of the leaderboard to show (10 users per page)",
+                                                required=False, default=1, min_value=1),
+                      around_me: discord.Option(bool, "Show the people ranked around you instead",
+                                                required=False, default=False)):
     try:
         await ctx.defer()  # Generating the image can take a while
 
-        filename = make_leaderboard(bot)
-        with open(filename, "rb") as file_pointer:
-            await ctx.followup.send(file=discord.File(file_pointer))
+        await rank_index.ensure_loaded()
+        if around_me:
+            first_rank = rank_index.first_rank_around(ctx.author.id, 5)
+            if first_rank is None:
+                await ctx.respond("You are not on the leaderboard yet. Send some messages to get ranked!")
+                return
+            count = 5
+        else:
+            first_rank = (page - 1) * 10 + 1
+            count = 10
+            if first_rank > max(rank_index.size(), 1):
+                pages = (rank_index.size() + 9) // 10
+                await ctx.respond(f"The leaderboard only has {pages} page{'s' if pages != 1 else ''}.")
+                return
+
+        user_rank = rank_index.rank(ctx.author.id)
+        content = f"You are ranked **#{user_rank:,}** out of {rank_index.size():,}." if user_rank else None
+
+        leaderboard_image = await run_image_job(ctx, "leaderboard", ("leaderboard", first_rank, count),
+                                                make_leaderboard, bot, first_rank, count)
+        await ctx.followup.send(content, file=discord.File(leaderboard_image, filename="leaderboard.png"))
 
+    except jobs.JobRejected as e:
+        await ctx.respond(str(e))
     except:
         await ctx.respond(
             "An error has occurred while fetching the leaderboard. Please alert an Executive.")
@@ -171,7 +247,7 @@ async def leaderboard(ctx):
 @bot.slash_command(name="connect_account", description="Connect your Discord account to your DMOJ account")
 async def connect_dmoj_account(ctx, username: discord.Option(str, "Your DMOJ username")):
     try:
-        connect_account(ctx.author.id, username)
+        await connect_account(ctx.author.id, username)
         await ctx.respond(f"Successfully connected your Discord account to **{username}**.")
 
     except:
@@ -186,7 +262,7 @@ async def plot_dmoj_points(ctx, user: discord.Option(discord.User, "Plot points
     try:
         await ctx.defer()
         user_id = user.id if user else ctx.author.id
-        user_data = get_user_data(user_id)
+        user_data = await user_cache.get_user(user_id)
         if user_data is None:
             if user:
                 await ctx.respond(
@@ -196,10 +272,12 @@ async def plot_dmoj_points(ctx, user: discord.Option(discord.User, "Plot points
                     "You have not connected to a DMOJ account yet. You can do so using `/connect_account [DMOJ username]`")
             return
 
-        history = fetch_point_history(user_data.dmoj_username)
-        plot_points(history, user_data.dmoj_username, "Points", "Points Progression")
-        await ctx.respond(file=discord.File('point_graph.png'))
+        graph = await run_image_job(ctx, "plot", ("plot_points", user_data.dmoj_username), plot_history,
+                                    fetch_point_history, user_data.dmoj_username, "Points", "Points Progression")
+        await ctx.respond(file=discord.File(graph, filename="point_graph.png"))
 
+    except jobs.JobRejected as e:
+        await ctx.respond(str(e))
     except:
         await ctx.respond("An error has occurred while plotting points. Please alert an Executive.")
         raise
@@ -211,7 +289,7 @@ async def plot_dmoj_problems(ctx, user: discord.Option(discord.User, "Plot probl
     try:
         await ctx.defer()
         user_id = user.id if user else ctx.author.id
-        user_data = get_user_data(user_id)
+        user_data = await user_cache.get_user(user_id)
         if user_data is None:
             if user:
                 await ctx.respond(
@@ -221,10 +299,13 @@ async def plot_dmoj_problems(ctx, user: discord.Option(discord.User, "Plot probl
                     "You have not connected to a DMOJ account yet. You can do so using `/connect_account [DMOJ username]`")
             return
 
-        history = fetch_problem_history(user_data.dmoj_username)
-        plot_points(history, user_data.dmoj_username, "Problems Solved", "Problems Progression")
-        await ctx.respond(file=discord.File('point_graph.png'))
+        graph = await run_image_job(ctx, "plot", ("plot_problems", user_data.dmoj_username), plot_history,
+                                    fetch_problem_history, user_data.dmoj_username, "Problems Solved",
+                                    "Problems Progression")
+        await ctx.respond(file=discord.File(graph, filename="point_graph.png"))
 
+    except jobs.JobRejected as e:
+        await ctx.respond(str(e))
     except:
         await ctx.respond("An error has occurred while plotting problems. Please alert an Executive.")
         raise
@@ -238,19 +319,23 @@ async def plot_problem_types_cmd(ctx, users: discord.Option(str,
         await ctx.defer()
         if not users:  # plot your own problem types
             user_id = ctx.author.id
-            user_data = get_user_data(user_id)
+            user_data = await user_cache.get_user(user_id)
             if user_data is None:
                 await ctx.respond(
                     "You have not connected to a DMOJ account yet. You can do so using `/connect_account [DMOJ username]`")
                 return
-            plot_problem_types([user_data.dmoj_username])
+            graph = await run_image_job(ctx, "plot", ("plot_problem_types", user_data.dmoj_username),
+                                        plot_problem_types, [user_data.dmoj_username])
 
         else:  # plot and compare other people's problem types
             dmoj_usernames = users.split(",")
             dmoj_usernames = list(map(lambda x: x.strip(), dmoj_usernames))  # strip whitespace from all usernames
-            plot_problem_types(dmoj_usernames)
-        await ctx.respond(file=discord.File('problem_types_graph.png'))
+            graph = await run_image_job(ctx, "plot", ("plot_problem_types", *dmoj_usernames),
+                                        plot_problem_types, dmoj_usernames)
+        await ctx.respond(file=discord.File(graph, filename="problem_types_graph.png"))
 
+    except jobs.JobRejected as e:
+        await ctx.respond(str(e))
     except Exception as e:
         await ctx.respond(f"An error has occurred while plotting types. Please alert an Executive. "
                           f"Error message: {e}")
@@ -266,24 +351,30 @@ async def plot_problem_types_cmd(ctx, users: discord.Option(str,
         await ctx.defer()
         if not users:  # plot your own problem types
             user_id = ctx.author.id
-            user_data = get_user_data(user_id)
+            user_data = await user_cache.get_user(user_id)
             if user_data is None:
                 await ctx.respond(
                     "You have not connected to a DMOJ account yet. You can do so using `/connect_account [DMOJ username]`")
                 return
-            plot_problem_types_weighted([user_data.dmoj_username])
+            graph = await run_image_job(ctx, "plot", ("plot_problem_types_weighted", user_data.dmoj_username),
+                                        plot_problem_types_weighted, [user_data.dmoj_username])
 
         else:  # plot and compare other people's problem types
             dmoj_usernames = users.split(",")
             dmoj_usernames = list(map(lambda x: x.strip(), dmoj_usernames))  # strip whitespace from all usernames
-            plot_problem_types_weighted(dmoj_usernames)
-        await ctx.respond(file=discord.File('problem_types_graph_weighted.png'))
+            graph = await run_image_job(ctx, "plot", ("plot_problem_types_weighted", *dmoj_usernames),
+                                        plot_problem_types_weighted, dmoj_usernames)
+        await ctx.respond(file=discord.File(graph, filename="problem_types_graph_weighted.png"))
 
+    except jobs.JobRejected as e:
+        await ctx.respond(str(e))
     except Exception as e:
         await ctx.respond(f"An error has occurred while plotting types. Please alert an Executive. "
                           f"Error message: {e}")
         raise
 
 
-keep_alive.keep_alive()
-bot.run(token)
+if __name__ == '__main__':
+    render_pool.warm_up()  # must happen before any other thread is started
+    keep_alive.keep_alive()
+    bot.run(token)
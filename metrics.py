@@ -0,0 +1,35 @@
+"""
+Prometheus metrics of the bot, served at `/metrics` by `keep_alive`.
+
+Cache hit rates are `bot_cache_requests_total{result="hit"}` over all `bot_cache_requests_total` of a cache.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+COMMAND_LATENCY = Histogram(
+    "bot_command_duration_seconds", "Time to handle a slash command", ["command"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+DMOJ_REQUESTS = Counter(
+    "bot_dmoj_requests_total", "Requests sent to DMOJ, by response status", ["endpoint", "status"]
+)
+DMOJ_LATENCY = Histogram(
+    "bot_dmoj_request_duration_seconds", "Time to download and parse a DMOJ response", ["endpoint"]
+)
+DB_POOL_WAIT = Histogram(
+    "bot_db_pool_wait_seconds", "Time waiting for a connection from the database pool",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+DB_POOL_IN_USE = Gauge("bot_db_pool_connections_in_use", "Database connections currently checked out")
+RENDER_DURATION = Histogram(
+    "bot_render_duration_seconds", "Time to render in the render pool, including the wait for a worker",
+    ["function"]
+)
+CACHE_REQUESTS = Counter("bot_cache_requests_total", "Cache lookups, by whether they were hits", ["cache", "result"])
+JOB_QUEUE_WAIT = Histogram(
+    "bot_job_queue_wait_seconds", "Time a job waited for a free slot of its class", ["job_class"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+JOBS_WAITING = Gauge("bot_jobs_waiting", "Jobs waiting for a free slot", ["job_class"])
+JOBS_JOINED = Counter("bot_jobs_joined_total", "Requests that joined a job already queued or running", ["job_class"])
+JOBS_REJECTED = Counter("bot_jobs_rejected_total", "New jobs rejected, by the limit they hit", ["job_class", "reason"])
@@ -1,108 +1,139 @@
 # for fetching data
-import requests
-import os
-from dotenv import load_dotenv
+import asyncio
 from collections import defaultdict
 import json
 
 # for plotting
 import matplotlib.pyplot as plt
-import datetime as dt
+import numpy as np
+from io import BytesIO
 
-from dmoj_utils import balance
+from dmoj_utils import Balancer
+from problem_catalog import CATEGORIES, get_catalog
+from submission_store import Submission, get_submissions
 
-load_dotenv("environment/.env")  # load all the variables from the env file
-api_key = os.getenv("DMOJ_PASSWORD")
+PLOT_WIDTH = 640  # width of the graph in pixels; longer histories are downsampled to about this many points
 
 
-def fetch_submission(user: str, page: int) -> dict:
-    url = f"https://dmoj.ca/api/v2/submissions?user={user}&page={page}"
-    headers = {"Authorization": f"Bearer {api_key}"}
-    response = requests.get(url, headers)
-    return response.json()
-
-
-def fetch_raw_point_history(user: str):
+class RawPointsHistory:
     """
-    get the data for the plotter
     plotted data: total points before balancing
     """
 
-    data = fetch_submission(user, 1)  # get number of submission pages
-    n_pages = data["data"]["total_pages"]
+    def __init__(self):
+        self.best = defaultdict(int)  # best points for each question
+        self.total = 0
+        self.history = []  # (times when points were gained, new point value)
+
+    def add(self, sub: Submission) -> None:
+        problem, points = sub.problem, sub.points
+        if problem not in self.best or self.best[problem] < points:  # gained points at this time
+            self.total += points - self.best[problem]  # add point gained
+            self.best[problem] = points
+            self.history.append((sub.date, self.total))
 
-    best = defaultdict(int)  # best points for each question
-    point_gains = []  # (times when points were gained, new point value)
-    total = 0
-    for page in range(1, n_pages + 1):  # process each page (need multiple requests)
-        data = fetch_submission(user, page)
-        submissions = data["data"]["objects"]
 
-        for sub in submissions:  # process each submission
-            problem = sub["problem"]
-            date = sub["date"].split("T")[0]
-            points = sub["points"] if sub["points"] != None else 0
+class PointsHistory:
+    """
+    plotted data: balanced points (after applying formula)
+    """
 
-            if problem not in best or best[problem] < points:  # gained points at this time
-                diff = points - best[problem]  # get point gained
-                total += diff
-                best[problem] = points
-                point_gains.append((date, total))
+    def __init__(self):
+        self.balancer = Balancer()  # best points for each question
+        self.history = []  # (times when points were gained, new point value)
 
-    return point_gains
+    def add(self, sub: Submission) -> None:
+        if self.balancer.improves(sub.problem, sub.points):  # gained points at this time
+            self.history.append((sub.date, self.balancer.update(sub.problem, sub.points, sub.result == "AC")))
 
 
-def fetch_point_history(user: str):
+class ProblemsHistory:
     """
-    get the data for the plotter
-    plotted data: balanced points (after applying formula)
+    plotted data: problems solved
     """
 
-    data = fetch_submission(user, 1)  # get number of submission pages
-    n_pages = data["data"]["total_pages"]
+    def __init__(self):
+        self.ac = set()
+        self.history = []  # (times when problems were solved, new problems solved)
 
-    best = defaultdict(int)  # best points for each question
-    point_gains = []  # (times when points were gained, new point value)
-    ac = set()
-    for page in range(1, n_pages + 1):  # process each page (need multiple requests)
-        data = fetch_submission(user, page)
-        submissions = data["data"]["objects"]
+    def add(self, sub: Submission) -> None:
+        if sub.result == "AC" and sub.problem not in self.ac:  # solved new problem
+            self.ac.add(sub.problem)
+            self.history.append((sub.date, len(self.ac)))
 
-        for sub in submissions:  # process each submission
-            problem = sub["problem"]
-            date = sub["date"].split("T")[0]
-            points = sub["points"] if sub["points"] != None else 0
 
-            if problem not in best or best[problem] < points:  # gained points at this time
-                if sub["result"] == "AC":  # solved new problem
-                    ac.add(problem)
-                best[problem] = points
-                point_gains.append((date, balance(best, ac)))
+class CategoryHistory:
+    """
+    plotted data: balanced points in each problem category
+    Problems missing from the catalog aren't counted.
+    """
 
-    return point_gains
+    def __init__(self):
+        self.catalog = get_catalog()
+        ac = set()  # shared by every category
+        self.balancers = [Balancer(ac) for _ in CATEGORIES]
+        self.history = defaultdict(list)  # category: (times when points were gained, new point value)
+
+    def add(self, sub: Submission) -> None:
+        i = self.catalog.index.get(sub.problem)
+        if i is None:
+            return
+        mask = self.catalog.masks[i]
+        for c, category in enumerate(CATEGORIES):
+            balancer = self.balancers[c]
+            if mask >> c & 1 and balancer.improves(sub.problem, sub.points):  # gained points at this time
+                balanced = balancer.update(sub.problem, sub.points, sub.result == "AC")
+                self.history[category].append((sub.date, balanced))
+
+
+HISTORIES = {
+    "raw_points": RawPointsHistory,
+    "points": PointsHistory,
+    "problems": ProblemsHistory,
+    "categories": CategoryHistory,
+}
+
+
+def build_histories(submissions, kinds=tuple(HISTORIES)) -> dict:
+    """
+    Builds every requested kind of history (see `HISTORIES`) in a single pass over the submissions.
+    """
+    builders = {kind: HISTORIES[kind]() for kind in kinds}
+    adders = [builder.add for builder in builders.values()]
+    for sub in submissions:
+        for add in adders:
+            add(sub)
+    return {kind: builder.history for kind, builder in builders.items()}
 
 
-def fetch_problem_history(user: str):
+async def fetch_histories(user: str, kinds=tuple(HISTORIES)) -> dict:
     """
-    get a user's history of problems solved
+    Syncs a user's submissions and builds every requested kind of history from them at once.
+    """
+    return build_histories(await get_submissions(user), kinds)
+
+
+async def fetch_raw_point_history(user: str):
+    """
+    get the data for the plotter
+    plotted data: total points before balancing
     """
-    data = fetch_submission(user, 1)  # get number of submission pages
-    n_pages = data["data"]["total_pages"]
+    return (await fetch_histories(user, ["raw_points"]))["raw_points"]
 
-    problems_solved = []  # (times when problems were solved, new problems solved)
-    ac = set()
-    for page in range(1, n_pages + 1):  # process each page (need multiple requests)
-        data = fetch_submission(user, page)
-        submissions = data["data"]["objects"]
 
-        for sub in submissions:  # process each submission
-            problem = sub["problem"]
-            date = sub["date"].split("T")[0]
-            if sub["result"] == "AC" and problem not in ac:  # solved new problem
-                ac.add(problem)
-                problems_solved.append((date, len(ac)))
+async def fetch_point_history(user: str):
+    """
+    get the data for the plotter
+    plotted data: balanced points (after applying formula)
+    """
+    return (await fetch_histories(user, ["points"]))["points"]
+
 
-    return problems_solved
+async def fetch_problem_history(user: str):
+    """
+    get a user's history of problems solved
+    """
+    return (await fetch_histories(user, ["problems"]))["problems"]
 
 
 def fetch_mock_data():
@@ -113,30 +144,61 @@ def fetch_mock_data():
     with open("dummy_submissions.json", "r") as dummy_data:
         data = json.load(dummy_data)
 
-    submissions = data["data"]["objects"]
-    best = defaultdict(int)  # best points for each question
-    point_gains = []  # (times when points were gained, new point value)
-    ac = set()
+    submissions = (
+        Submission(
+            id=sub["id"],
+            problem=sub["problem"],
+            date=sub["date"].split("T")[0],
+            points=sub["points"] if sub["points"] != "None" else 0,
+            result=sub["result"]
+        )
+        for sub in data["data"]["objects"]
+    )
+    return build_histories(submissions, ["points"])["points"]
 
-    for sub in submissions:  # process each submission
-        problem = sub["problem"]
-        date = sub["date"].split("T")[0]
-        points = sub["points"] if sub["points"] != "None" else 0
 
-        if problem not in best or best[problem] < points:  # gained points at this time
-            if sub["result"] == "AC":  # solved new problem
-                ac.add(problem)
-            best[problem] = points
-            point_gains.append((date, balance(best, ac)))
-    return point_gains
+def daily_values(history: list) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Converts a history to arrays of dates and values, keeping only the last value of each day.
+    """
+    dates = np.array([d for d, _ in history]).astype("datetime64[D]")  # parses every date at once
+    values = np.array([v for _, v in history], dtype=float)
+    last_of_day = np.append(dates[1:] != dates[:-1], True)  # the history is in chronological order
+    return dates[last_of_day], values[last_of_day]
 
 
-def plot_points(history: list, name: str, y_text: str, title: str):
+def downsample(x: np.ndarray, y: np.ndarray, n_out: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Picks `n_out` of the points with largest-triangle-three-buckets (LTTB),
+    which keeps the peaks and the shape of the line.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return x, y
+
+    xf = x.astype(np.float64)
+    bucket = (n - 2) / (n_out - 2)
+    picked = np.empty(n_out, dtype=np.intp)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0  # last picked point
+    for i in range(n_out - 2):
+        start, end = int(i * bucket) + 1, int((i + 1) * bucket) + 1
+        next_end = min(int((i + 2) * bucket) + 1, n)
+        avg_x, avg_y = xf[end:next_end].mean(), y[end:next_end].mean()
+
+        # pick the point making the largest triangle with the last picked point and the next bucket's average
+        area = np.abs((xf[a] - avg_x) * (y[start:end] - y[a]) - (xf[a] - xf[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        picked[i + 1] = a
+    return x[picked], y[picked]
+
+
+def plot_points(history: list, name: str, y_text: str, title: str) -> BytesIO:
     """
-    saves a picture of the graph
+    returns a picture of the graph as an in-memory PNG
     """
-    x = [dt.datetime.strptime(d[0], '%Y-%m-%d').date() for d in history]  # extract time as datetime
-    y = list(map(lambda x: x[1], history))
+    x, y = daily_values(history)
+    x, y = downsample(x, y, PLOT_WIDTH)  # more points than pixels wouldn't show anyway
 
     # labels
     plt.xlabel("Date", fontsize=9)
@@ -148,23 +210,25 @@ def plot_points(history: list, name: str, y_text: str, title: str):
     # save plot as image
     plt.plot(x, y, label=f"{name} ({round(history[-1][1], 2)})")
     plt.legend(loc="upper left")
-    plt.savefig('point_graph.png')
+    buffer = BytesIO()
+    plt.savefig(buffer, format="png")
     plt.close()
+    buffer.seek(0)
+    return buffer
 
 
 if __name__ == '__main__':
     TESTING = 0
     user = "Ivan_Li"
 
-    load_dotenv("environment/.env")  # load all the variables from the env file
-    token = os.getenv("DMOJ_PASSWORD")
     if TESTING:
         history = fetch_mock_data()
     else:
-        history = fetch_problem_history(user)
+        history = asyncio.run(fetch_problem_history(user))
 
     # plot points
-    plot_points(history, user, "Points", "Points Progression")
+    with open("point_graph.png", "wb") as graph:
+        graph.write(plot_points(history, user, "Points", "Points Progression").getvalue())
 
     # # plot problems solved
     # plot_points(history, user, "Problems Solved", "Problems Progression")
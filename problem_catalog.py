@@ -0,0 +1,416 @@
+"""
+Index of the types and points of every DMOJ problem, loaded once from `problem_info.json`.
+
+The catalog is kept as NumPy arrays, so the totals of every problem a user solved
+can be computed at once instead of looping over dicts.
+A binary copy (`problem_info.npz`) is saved next to the JSON and used while it is up to date,
+since it loads much faster.
+
+`refresh` crawls the DMOJ problem list to bring `problem_info.json` up to date,
+and `resolve` looks up problems that are newer than the catalog one by one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+from bs4 import BeautifulSoup, SoupStrainer
+
+from dmoj_client import fetch_json, fetch_text
+
+CATALOG_PATH = "problem_info.json"
+BINARY_PATH = "problem_info.npz"
+PAGES = 160  # max pages on DMOJ, used if the number of pages can't be read
+REFRESH_CONCURRENCY = 4  # problem list pages fetched at the same time
+REFRESH_RATE = 2  # maximum problem list requests started per second
+REFRESH_INTERVAL = 24 * 60 * 60  # seconds between refreshes when running inside the bot
+LOOKUP_DELAY = 0.05  # seconds to wait for more unknown problems before looking them up together
+LOOKUP_CONCURRENCY = 4  # unknown problems looked up at the same time
+LOOKUP_RATE = 10  # maximum problem lookups started per second
+NOT_FOUND_TTL = 60 * 60  # seconds to remember that a problem doesn't exist on DMOJ
+CATEGORIES = ["Data Structures", "Greedy Algorithms", "Ad Hoc",
+              "Math", "String Algorithms", "Graph Theory", "Dynamic Programming", "Implementation"]
+
+
+def category_of(problem_type: str) -> str:
+    """
+    Returns the category a problem type is counted in.
+    """
+    if "Math" in problem_type:  # combine all 3 math categories
+        return "Math"
+    return problem_type
+
+
+class ProblemCatalog:
+    """
+    Types and points of every problem, stored as arrays indexed by problem.
+    """
+
+    def __init__(self, codes, type_counts, n_types, points):
+        self.codes = list(codes)
+        self.index = {code: i for i, code in enumerate(self.codes)}  # problem code: index in the arrays
+        self.type_counts = type_counts
+        """
+        `type_counts[i, c]` is how many of problem i's types are counted in `CATEGORIES[c]`.
+        """
+        self.n_types = n_types
+        """
+        Total number of types of each problem, including the ones that aren't in `CATEGORIES`.
+        """
+        self.points = points
+        bits = 1 << np.arange(len(CATEGORIES))
+        self.masks = ((type_counts > 0) * bits).sum(axis=1).astype(np.uint8)
+        """
+        Bit c is set if the problem has a type counted in `CATEGORIES[c]`.
+        """
+
+    @classmethod
+    def from_json(cls, type_table: dict) -> ProblemCatalog:
+        codes = list(type_table)
+        type_counts = np.zeros((len(codes), len(CATEGORIES)), dtype=np.uint8)
+        n_types = np.zeros(len(codes), dtype=np.uint8)
+        points = np.zeros(len(codes), dtype=np.int32)
+        category_index = {category: c for c, category in enumerate(CATEGORIES)}
+
+        for i, code in enumerate(codes):
+            info = type_table[code]
+            n_types[i] = len(info["types"])
+            points[i] = info["points"]
+            for problem_type in info["types"]:
+                c = category_index.get(category_of(problem_type))
+                if c is not None:
+                    type_counts[i, c] += 1
+        return cls(codes, type_counts, n_types, points)
+
+    @classmethod
+    def load(cls, path: str = CATALOG_PATH, binary_path: str = BINARY_PATH) -> ProblemCatalog:
+        """
+        Loads the catalog, from the binary copy if it is newer than the JSON.
+        """
+        if os.path.exists(binary_path) and os.path.getmtime(binary_path) >= os.path.getmtime(path):
+            with np.load(binary_path) as arrays:
+                return cls(arrays["codes"].tolist(), arrays["type_counts"], arrays["n_types"], arrays["points"])
+
+        with open(path, "r") as problem_types:
+            catalog = cls.from_json(json.load(problem_types))
+        try:
+            catalog.save_binary(binary_path)
+        except OSError as e:
+            print("Failed to save binary problem catalog: " + str(e))
+        return catalog
+
+    def save_binary(self, binary_path: str = BINARY_PATH) -> None:
+        with _atomic_write(binary_path, "wb") as file:
+            np.savez(file, codes=np.array(self.codes), type_counts=self.type_counts, n_types=self.n_types,
+                     points=self.points)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def indices(self, problems) -> np.ndarray:
+        """
+        Returns the index of each of the given problem codes. Unknown problems are skipped.
+        """
+        index = self.index
+        return np.fromiter((index[p] for p in problems if p in index), dtype=np.intp)
+
+    def type_totals(self, problems) -> dict[str, float]:
+        """
+        Returns how many of the given problems are of each category.
+        A problem with several types counts as a fraction of a problem in each of them.
+        Unknown problems aren't counted; see `resolve`.
+        """
+        idx = self.indices(problems)
+        shares = self.type_counts[idx] / np.maximum(self.n_types[idx], 1)[:, None]
+        totals = shares.sum(axis=0)
+        return {category: float(total) for category, total in zip(CATEGORIES, totals)}
+
+    def total_points(self, problems) -> int:
+        """
+        Returns the sum of the points of the given problems. Unknown problems aren't counted.
+        """
+        return int(self.points[self.indices(problems)].sum())
+
+    def category_points(self, problems) -> dict[str, list[int]]:
+        """
+        Returns the points of the given problems in each category.
+        A problem appears once for every one of its types in the category.
+        Unknown problems aren't counted; see `resolve`.
+        """
+        idx = self.indices(problems)
+        points = self.points[idx]
+        counts = self.type_counts[idx]
+        return {category: np.repeat(points, counts[:, c]).tolist() for c, category in enumerate(CATEGORIES)}
+
+
+class _atomic_write:
+    """
+    Opens a temporary file that replaces `path` once it is closed without errors,
+    so a crash never leaves a half written file behind.
+    """
+
+    def __init__(self, path: str, mode: str = "w"):
+        self.path = path
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        self.file = os.fdopen(fd, mode)
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+
+_catalog = None
+_table_lock = asyncio.Lock()  # changes to `problem_info.json` are saved one at a time, so none of them is lost
+
+
+def get_catalog() -> ProblemCatalog:
+    """
+    Returns the problem catalog, loading it on first use.
+    """
+    global _catalog
+    if _catalog is None:
+        _catalog = ProblemCatalog.load()
+    return _catalog
+
+
+def _read_table() -> dict:
+    try:
+        with open(CATALOG_PATH, "r") as problem_types:
+            return json.load(problem_types)
+    except FileNotFoundError:
+        return {}
+
+
+def _apply_changes(changes: dict, removed) -> ProblemCatalog:
+    """
+    Adds or replaces `changes` and deletes `removed` in `problem_info.json`, then writes its binary copy.
+    Runs in a worker thread. Returns the updated catalog.
+    """
+    type_table = _read_table()
+    type_table.update(changes)
+    for code in removed:
+        type_table.pop(code, None)
+    with _atomic_write(CATALOG_PATH) as problem_types:
+        json.dump(type_table, problem_types)
+
+    catalog = ProblemCatalog.from_json(type_table)
+    try:
+        catalog.save_binary()
+    except OSError as e:
+        print("Failed to save binary problem catalog: " + str(e))
+    return catalog
+
+
+async def _save_changes(changes: dict, removed=()) -> None:
+    """
+    Saves changes to the catalog without blocking the event loop, and replaces the loaded catalog.
+    """
+    global _catalog
+    async with _table_lock:
+        _catalog = await asyncio.to_thread(_apply_changes, changes, removed)
+
+
+def parse_problem_page(html: str) -> tuple[dict, int]:
+    """
+    Returns the types and points of every problem on a page of the problem list,
+    and the number of pages in the problem list (0 if it can't be found).
+    """
+    soup = BeautifulSoup(html, "lxml", parse_only=SoupStrainer(["tr", "ul"]))
+    type_table = {}
+    for row in soup.find_all("td", class_="problem"):
+        url_element = row.find("a")
+        problem_url = url_element["href"].split("/")[-1]
+
+        types_element = row.parent.find("td", class_="types")
+        types = [t.text for t in types_element.find_all("span")]
+
+        points_element = row.parent.find("td", class_="p")
+        points = int("".join(i for i in points_element.text if i != "p"))
+        type_table[problem_url] = {"types": types, "points": points}
+
+    page_numbers = [int(a.text) for a in soup.select("ul.pagination a") if a.text.strip().isdigit()]
+    return type_table, max(page_numbers, default=0)
+
+
+class _RateLimiter:
+    """
+    Lets at most `concurrency` requests run at once, and starts at most `rate` of them per second.
+    """
+
+    def __init__(self, concurrency: int, rate: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1 / rate
+        self.next_start = 0
+        self.lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self.lock:
+            delay = self.next_start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_start = max(self.next_start, time.monotonic()) + self.interval
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+async def refresh(concurrency: int = REFRESH_CONCURRENCY, rate: float = REFRESH_RATE) -> int:
+    """
+    Crawls the DMOJ problem list and updates `problem_info.json` and the loaded catalog.
+    Returns the number of problems that were added, changed or removed.
+    """
+    limiter = _RateLimiter(concurrency, rate)
+
+    async def fetch_page(page: int):
+        async with limiter:
+            html = await fetch_text("/problems/", {"show_types": 1, "page": page})
+        return parse_problem_page(html)
+
+    first_rows, n_pages = await fetch_page(1)
+    n_pages = n_pages or PAGES
+    results = await asyncio.gather(*map(fetch_page, range(2, n_pages + 1)), return_exceptions=True)
+
+    crawled = dict(first_rows)
+    complete = True
+    for page, result in enumerate(results, start=2):
+        if isinstance(result, Exception):
+            print(f"Failed to fetch problem page {page}: {result}")
+            complete = False
+        else:
+            crawled.update(result[0])
+
+    type_table = await asyncio.to_thread(_read_table)
+    changes = {code: info for code, info in crawled.items() if type_table.get(code) != info}
+    # problems can only be known to be gone if every page was read
+    removed = [code for code in type_table if code not in crawled] if complete else []
+    if not changes and not removed:
+        print("Problem info is already up to date")
+        return 0
+
+    await _save_changes(changes, removed)
+    print(f"Successfully saved problem info ({len(changes)} added or changed, {len(removed)} removed)")
+    return len(changes) + len(removed)
+
+
+_lookups = {}  # problem code: future set once the problem was looked up
+_lookup_queue = []  # problem codes waiting for the next batch of lookups
+_lookup_task = None
+_not_found = {}  # problem code: time when DMOJ said the problem doesn't exist
+
+
+async def _fetch_problem(code: str) -> dict | None:
+    """
+    Returns the types and points of a problem from the DMOJ API, or `None` if it doesn't exist.
+    """
+    try:
+        data = await fetch_json(f"/api/v2/problem/{code}")
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
+            return None
+        raise
+    problem = data["data"]["object"]
+    return {"types": problem["types"], "points": int(problem["points"])}
+
+
+async def _look_up_queued() -> None:
+    """
+    Looks up every queued problem at once and adds the ones that exist to the catalog.
+    """
+    global _lookup_task
+    await asyncio.sleep(LOOKUP_DELAY)  # let other commands queue their problems too
+    codes = list(_lookup_queue)
+    _lookup_queue.clear()
+    _lookup_task = None
+
+    limiter = _RateLimiter(LOOKUP_CONCURRENCY, LOOKUP_RATE)
+
+    async def look_up(code):
+        async with limiter:
+            return await _fetch_problem(code)
+
+    try:
+        results = await asyncio.gather(*map(look_up, codes), return_exceptions=True)
+        found = {}
+        for code, result in zip(codes, results):
+            if isinstance(result, Exception):
+                print(f"Failed to look up problem {code}: {result}")
+            elif result is None:
+                _not_found[code] = time.time()
+            else:
+                found[code] = result
+        if found:
+            await _save_changes(found)
+    except Exception as e:
+        print("Failed to save looked up problems: " + str(e))
+    finally:
+        for code in codes:
+            future = _lookups.pop(code)
+            if not future.done():
+                future.set_result(None)
+
+
+async def resolve(problems) -> ProblemCatalog:
+    """
+    Returns the catalog, after looking up the given problems that it doesn't know yet.
+    Lookups from concurrent calls are batched, and each unknown problem is only requested once.
+    Problems that can't be found are left out of the catalog.
+    """
+    global _lookup_task
+    catalog = get_catalog()
+    now = time.time()
+    unknown = {
+        p for p in problems
+        if p not in catalog and now - _not_found.get(p, -NOT_FOUND_TTL) >= NOT_FOUND_TTL
+    }
+    if not unknown:
+        return catalog
+
+    for code in unknown:
+        if code not in _lookups:
+            _lookups[code] = asyncio.get_running_loop().create_future()
+            _lookup_queue.append(code)
+    if _lookup_queue and _lookup_task is None:
+        _lookup_task = asyncio.create_task(_look_up_queued())
+    await asyncio.gather(*(asyncio.shield(_lookups[code]) for code in unknown))
+    return get_catalog()
+
+
+async def refresh_periodically(interval: float = REFRESH_INTERVAL) -> None:
+    """
+    Refreshes the catalog every `interval` seconds. Meant to run as a background task of the bot.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh()
+        except Exception as e:
+            print("Failed to refresh problem info: " + str(e))
+
+
+_refresh_task = None
+
+
+def start_refreshing() -> None:
+    """
+    Starts refreshing the catalog in the background, unless it was already started.
+    """
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(refresh_periodically())
+
+
+if __name__ == '__main__':
+    asyncio.run(refresh())
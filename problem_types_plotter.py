@@ -1,17 +1,13 @@
 # for fetching data
-import requests
-from bs4 import BeautifulSoup
-import os
-from dotenv import load_dotenv
 
-import json
-import time
-from collections import defaultdict
+import asyncio
+from functools import lru_cache
+from io import BytesIO
 
 # for plotting
-import matplotlib.pyplot as plt
 import numpy as np
 
+from matplotlib.figure import Figure
 from matplotlib.patches import Circle, RegularPolygon
 from matplotlib.path import Path
 from matplotlib.projections import register_projection
@@ -19,14 +15,13 @@ from matplotlib.projections.polar import PolarAxes
 from matplotlib.spines import Spine
 from matplotlib.transforms import Affine2D
 
+import render_pool
+
 # for dmoj specific functions
 from dmoj_utils import balance_full_acs
+from dmoj_client import fetch_json
+from problem_catalog import CATEGORIES, resolve
 
-load_dotenv("environment/.env")  # load all the variables from the env file
-api_key = os.getenv("DMOJ_PASSWORD")
-PAGES = 160  # max pages on DMOJ
-CATEGORIES = ["Data Structures", "Greedy Algorithms", "Ad Hoc",
-              "Math", "String Algorithms", "Graph Theory", "Dynamic Programming", "Implementation"]
 
 
 def radar_factory(num_vars, frame='circle'):
@@ -119,142 +114,89 @@ def radar_factory(num_vars, frame='circle'):
     return theta
 
 
-def update_problem_info():
-    """Go through all problems on DMOJ and store their types"""
-    type_table = {}
-    for i in range(1, PAGES + 1):  # go through all pages on DMOJ
-        try:
-            url = f"https://dmoj.ca/problems/?show_types=1&page={i}"
-            html_content = requests.get(url).text
-        except:  # all pages visited
-            break
-        soup = BeautifulSoup(html_content, features="html.parser")
+@lru_cache
+def _radar_template():
+    """
+    The radar chart's projection, figure and axes, with the grid and labels drawn.
+    Built once in each process and reused by every chart drawn there.
+    """
+    N = len(CATEGORIES)
+    theta = radar_factory(N, frame='polygon')
+    fig = Figure(figsize=(6, 6))  # not managed by pyplot, so other plots can't close it
+    ax = fig.add_subplot(projection='radar')
+    ax.set_varlabels(CATEGORIES)
+    return theta, fig, ax
 
-        for row in soup.find_all("td", class_="problem"):
-            url_element = row.find("a")
-            problem_url = url_element["href"].split("/")[-1]
-            type_table[problem_url] = {}
 
-            types_element = row.parent.find("td", class_="types")
-            types = [t.text for t in types_element.find_all("span")]
-            type_table[problem_url]["types"] = types
+def draw_radar(users, data) -> BytesIO:
+    """
+    Draws each user's values for every category on a radar chart. Runs in the render pool.
+    Returns the chart as an in-memory PNG.
+    """
+    theta, fig, ax = _radar_template()
 
-            points_element = row.parent.find("td", class_="p")
-            points = int("".join(i for i in points_element.text if i != "p"))
-            type_table[problem_url]["points"] = points
+    # remove the previous chart's data, and start again from the first color
+    for artist in [*ax.lines, *ax.patches]:
+        artist.remove()
+    ax.set_prop_cycle(None)
 
-        print(f"finished page {i}/{PAGES}")
-        time.sleep(1)  # prevent rate limit
+    # plot each person's data
+    for d in data:
+        ax.plot(theta, d)
+        ax.fill(theta, d, alpha=0.09, label='_nolegend_')
+    ax.relim()
+    ax.autoscale_view()
 
-    with open("problem_info.json", "w") as problem_types:
-        json.dump(type_table, problem_types)
-    print("Successfully saved data")
+    # legend for each user's color
+    ax.legend(users, loc=(-0.15, 0.9), fontsize="medium")
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    return buffer
 
 
-def get_user_problem_types(user: str) -> dict:
+async def get_user_problem_types(user: str) -> dict:
     """Returns how many problems of each type a user has solved"""
-    url = f"https://dmoj.ca/api/v2/user/{user}"
-
-    headers = {"Authorization": f"Bearer {api_key}"}
-    user = requests.get(url, headers).json()
+    user = await fetch_json(f"/api/v2/user/{user}")
     problems = user["data"]["object"]["solved_problems"]
 
-    with open("problem_info.json", "r") as problem_types:
-        type_table = json.load(problem_types)
-    total = defaultdict(int)
-    for p in problems:
-        if p not in type_table:
-            raise KeyError(f"Problem code '{p}' not found. 'problem_info.json' may be outdated.")
-
-        types = type_table[p]["types"]
-        split_val = 1 / len(types)  # if a problem has 2 types, add 1/2 to each
-        for t in types:
-            if "Math" in t:  # combine all 3 math categories
-                total["Math"] += split_val
-            else:
-                total[t] += split_val
-    return total
+    # if a problem has 2 types, add 1/2 to each
+    catalog = await resolve(problems)
+    return catalog.type_totals(problems)
 
 
-def plot_problem_types(users):
+async def plot_problem_types(users) -> BytesIO:
     """Generate a plot based on how many of each type a user has solved."""
     if len(users) > 5:
         raise Exception("Too many users (5 max)")
-    N = len(CATEGORIES)
-    theta = radar_factory(N, frame='polygon')
 
     # get each user's type data
-    data = []
-    for user in users:
-        user = get_user_problem_types(user)
-        data.append([user[i] for i in CATEGORIES])
-    fig, ax = plt.subplots(figsize=(6, 6), subplot_kw=dict(projection='radar'))
-
-    # plot each person's data
-    for d in data:
-        ax.plot(theta, d)
-        ax.fill(theta, d, alpha=0.09, label='_nolegend_')
-    ax.set_varlabels(CATEGORIES)
-
-    # legend for each user's color
-    ax.legend(users, loc=(-0.15, 0.9), fontsize="medium")
-    plt.savefig("problem_types_graph.png")
-    # plt.show()  # uncomment when testing
-    plt.close()
+    types = await asyncio.gather(*map(get_user_problem_types, users))
+    data = [[user[i] for i in CATEGORIES] for user in types]
+    return await render_pool.run(draw_radar, users, data)
 
 
-def get_user_problem_types_weighted(user: str):
+async def get_user_problem_types_weighted(user: str):
     """Returns the weighted point value of all problems of each type a user has solved"""
-    url = f"https://dmoj.ca/api/v2/user/{user}"
-
-    headers = {"Authorization": f"Bearer {api_key}"}
-    user = requests.get(url, headers).json()
+    user = await fetch_json(f"/api/v2/user/{user}")
     problems = user["data"]["object"]["solved_problems"]
 
-    with open("problem_info.json", "r") as problem_types:
-        type_table = json.load(problem_types)
-    total = defaultdict(list)
-    for p in problems:
-        if p not in type_table:
-            raise KeyError(f"Problem code '{p}' not found. 'problem_info.json' may be outdated.")
-
-        types = type_table[p]["types"]
-        points = type_table[p]["points"]
-        for t in types:
-            if "Math" in t:  # combine all 3 math categories
-                total["Math"].append(points)
-            else:
-                total[t].append(points)
-    return total
+    catalog = await resolve(problems)
+    return catalog.category_points(problems)
 
 
-def plot_problem_types_weighted(users):
+async def plot_problem_types_weighted(users) -> BytesIO:
     """Generate a plot based on how many of each type a user has solved."""
     if len(users) > 5:
         raise Exception("Too many users (5 max)")
-    N = len(CATEGORIES)
-    theta = radar_factory(N, frame='polygon')
 
     # get each user's type data
-    data = []
-    for user in users:
-        user = get_user_problem_types_weighted(user)
-        data.append([balance_full_acs(user[i]) for i in CATEGORIES])  # todo: also make it consider partial AC
-    fig, ax = plt.subplots(figsize=(6, 6), subplot_kw=dict(projection='radar'))
-
-    # plot each person's data
-    for d in data:
-        ax.plot(theta, d)
-        ax.fill(theta, d, alpha=0.09, label='_nolegend_')
-    ax.set_varlabels(CATEGORIES)
-
-    # legend for each user's color
-    ax.legend(users, loc=(-0.15, 0.9), fontsize="medium")
-    plt.savefig("problem_types_graph_weighted.png")
-    # plt.show()  # uncomment when testing
-    plt.close()
+    types = await asyncio.gather(*map(get_user_problem_types_weighted, users))
+    data = [[balance_full_acs(user[i]) for i in CATEGORIES] for user in types]  # todo: also make it consider partial AC
+    return await render_pool.run(draw_radar, users, data)
 
 
 if __name__ == '__main__':
-    plot_problem_types_weighted(["ivan_li"])
-    #update_problem_info()
+    with open("problem_types_graph_weighted.png", "wb") as graph:
+        graph.write(asyncio.run(plot_problem_types_weighted(["ivan_li"])).getvalue())
+    # to update problem_info.json, run problem_catalog.py
@@ -0,0 +1,85 @@
+"""
+In-memory index of every user's experience, used to answer leaderboard rank queries.
+
+Users are kept sorted by experience, so finding a user's rank or any range of ranks
+takes O(log n) instead of sorting the whole table for every query.
+The index is loaded from the database once and then kept up to date by `user_cache`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from sortedcontainers import SortedList
+
+from user_data import get_all_experience
+
+_entries = SortedList()  # (-experience, user_id), best rank first
+_keys = {}  # user_id: the user's entry in `_entries`
+_loaded = False
+_load_lock = asyncio.Lock()
+
+
+async def ensure_loaded() -> None:
+    """
+    Loads every user from the database, unless it was already done.
+    """
+    global _loaded
+    async with _load_lock:
+        if _loaded:
+            return
+        for user_id, experience in await get_all_experience():
+            if user_id not in _keys:  # users updated while loading are already up to date
+                update(user_id, experience)
+        _loaded = True
+
+
+def update(user_id: int, experience: int) -> None:
+    """
+    Sets the experience of a user, adding the user if needed.
+    """
+    key = (-experience, user_id)
+    old_key = _keys.get(user_id)
+    if old_key == key:
+        return
+    if old_key is not None:
+        _entries.remove(old_key)
+    _entries.add(key)
+    _keys[user_id] = key
+
+
+def size() -> int:
+    """
+    Returns the number of ranked users.
+    """
+    return len(_entries)
+
+
+def rank(user_id: int) -> int | None:
+    """
+    Returns the rank of a user, starting at 1, or `None` if the user isn't ranked.
+    """
+    key = _keys.get(user_id)
+    if key is None:
+        return None
+    return _entries.index(key) + 1
+
+
+def users_in_range(first_rank: int, count: int) -> list[int]:
+    """
+    Returns the ids of the users ranked `first_rank` to `first_rank + count - 1`, best first.
+    """
+    start = max(first_rank - 1, 0)
+    return [user_id for _, user_id in _entries.islice(start, start + count)]
+
+
+def first_rank_around(user_id: int, count: int) -> int | None:
+    """
+    Returns the first rank of the `count` users centered around a user,
+    or `None` if the user isn't ranked.
+    """
+    user_rank = rank(user_id)
+    if user_rank is None:
+        return None
+    first = min(user_rank - count // 2, size() - count + 1)
+    return max(first, 1)
@@ -0,0 +1,65 @@
+"""
+Process pool for the CPU-heavy image and chart rendering.
+Rendering in another process keeps the event loop free to handle other commands and messages.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+WORKERS = os.cpu_count() or 1
+
+_executor = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # fork so the workers start with every module, font and base image already loaded
+        context = multiprocessing.get_context("fork")
+        _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=context)
+    return _executor
+
+
+def _warm_up_worker() -> int:
+    import matplotlib.pyplot as plt
+
+    # the first figure of a process is much slower than the rest
+    plt.figure()
+    plt.close()
+    return os.getpid()
+
+
+def warm_up() -> None:
+    """
+    Starts every worker process and waits until they are ready.
+    Call this before starting any other thread (forking a process with running threads is unsafe).
+    """
+    executor = get_executor()
+    futures = [executor.submit(_warm_up_worker) for _ in range(WORKERS)]
+    pids = {future.result() for future in futures}
+    print(f"Render pool ready ({len(pids)} workers)")
+
+
+async def run(func, *args):
+    """
+    Runs `func(*args)` in a worker process and returns the result.
+    `func` must be a module-level function, and its arguments and result must be picklable.
+    """
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(get_executor(), func, *args)
+    finally:
+        metrics.RENDER_DURATION.labels(func.__name__).observe(time.perf_counter() - start)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
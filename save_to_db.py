@@ -3,13 +3,14 @@ WARNING: DB INFO GETS OVERRIDE
 Save the information in the `userdata` folder to the database
 """
 
+import asyncio
 import os
-from user_data import UserData
+from user_data import UserData, close_pool
 
 USERDATA_FOLDER = "userdata"
 
-if __name__ == '__main__':
-    users = []
+
+async def main():
     for f in os.listdir(USERDATA_FOLDER):
         if not f.endswith(".txt"):  # only care about user_data info
             continue
@@ -19,4 +20,9 @@ if __name__ == '__main__':
                 args.append(i.strip())
         args = args[:2] + list(map(int, args[2:]))
         args_ud = UserData(*args)
-        args_ud.save_to_db()
+        await args_ud.save_to_db()
+    await close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""
+Local store of the DMOJ submissions of every user we have plotted.
+
+Each user's submissions are kept in `submissions/<username>.jsonl`, one submission per line, oldest first.
+Since DMOJ lists submissions from oldest to newest, a sync only needs to fetch the pages
+past the submissions we already have.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import defaultdict
+from typing import Iterator, NamedTuple
+
+import aiohttp
+
+from dmoj_client import fetch_submission_pages
+
+SUBMISSIONS_FOLDER = "submissions"
+SUBMISSIONS_PER_PAGE = 1000  # page size of /api/v2/submissions
+
+
+class Submission(NamedTuple):
+    id: int
+    problem: str
+    date: str  # YYYY-MM-DD
+    points: float
+    result: str
+
+
+_meta = {}  # username: (number of stored submissions, highest stored submission id)
+_locks = defaultdict(asyncio.Lock)  # prevents two syncs of the same user from running at once
+
+
+def _path(user: str) -> str:
+    return os.path.join(SUBMISSIONS_FOLDER, f"{user.lower()}.jsonl")
+
+
+def iter_submissions(user: str) -> Iterator[Submission]:
+    """
+    Yields every stored submission of a user, oldest first.
+    Does not fetch anything from DMOJ; use `get_submissions` for up-to-date data.
+    """
+    try:
+        file = open(_path(user), "r")
+    except FileNotFoundError:
+        return
+    with file:
+        for line in file:
+            try:
+                yield Submission(*json.loads(line))
+            except (ValueError, TypeError):  # line cut off by a crash while writing
+                continue
+
+
+def _get_meta(user: str) -> tuple[int, int]:
+    key = user.lower()
+    if key not in _meta:
+        count, max_id = 0, 0
+        for sub in iter_submissions(user):
+            count += 1
+            max_id = max(max_id, sub.id)
+        _meta[key] = count, max_id
+    return _meta[key]
+
+
+def _append(user: str, submissions: list[Submission]) -> None:
+    os.makedirs(SUBMISSIONS_FOLDER, exist_ok=True)
+    with open(_path(user), "a") as file:
+        file.writelines(json.dumps(sub) + "\n" for sub in submissions)
+    count, _ = _get_meta(user)
+    _meta[user.lower()] = count + len(submissions), submissions[-1].id
+
+
+async def _fetch_new(user: str, first_page: int, max_id: int) -> int | None:
+    """
+    Adds the submissions newer than `max_id` to the store, reading pages from `first_page` onwards.
+    Each page is saved as soon as it is read, so only one page of submissions is kept in memory.
+    Returns the number of new submissions, or `None` if submissions before `first_page` might have been missed.
+    """
+    added = 0
+    pages = fetch_submission_pages(user, first_page)
+    try:
+        async for submissions in pages:
+            if first_page > 1 and submissions and submissions[0][0] > max_id:
+                return None  # some submissions were deleted, so the page numbers shifted
+            first_page = 1  # only check the first page
+
+            new = []
+            judging = False
+            for sub_id, problem, date, points, result in submissions:
+                if sub_id <= max_id:
+                    continue
+                if result is None:  # still being judged, pick it up on the next sync
+                    judging = True
+                    break
+                new.append(Submission(
+                    id=sub_id,
+                    problem=problem,
+                    date=date.split("T")[0],
+                    points=points if points is not None else 0,
+                    result=result
+                ))
+            if new:
+                _append(user, new)
+                added += len(new)
+            if judging:
+                break
+        return added
+    finally:
+        await pages.aclose()  # stops fetching the remaining pages if we returned early
+
+
+async def sync(user: str) -> int:
+    """
+    Fetches the submissions a user made since the last sync and adds them to the store.
+    Returns the number of new submissions.
+    """
+    async with _locks[user.lower()]:
+        count, max_id = _get_meta(user)
+        # the page holding our newest submission, so it starts with one we have unless the pages shifted
+        first_page = (count - 1) // SUBMISSIONS_PER_PAGE + 1 if count else 1
+
+        try:
+            added = await _fetch_new(user, first_page, max_id)
+        except aiohttp.ClientResponseError as e:
+            if e.status != 404 or first_page == 1:
+                raise
+            added = None  # page no longer exists
+        if added is None:  # start again from the first page, skipping what we already have
+            added = await _fetch_new(user, 1, max_id)
+        return added
+
+
+async def get_submissions(user: str) -> Iterator[Submission]:
+    """
+    Brings the store up to date with DMOJ and returns the user's submissions, oldest first.
+    """
+    await sync(user)
+    return iter_submissions(user)
@@ -1,10 +1,91 @@
-import requests
-import json
-
-def translate_text(text, source_language="auto", target_language="en"):
-    text = text.replace("|"," ")
-    url = "https://translate.googleapis.com/translate_a/single?client=gtx&sl=" + source_language + "&tl=" + target_language + "&dt=t&q=" + text
-    response = requests.get(url)
-    response_text = json.loads(response.text)
-    translated_text = response_text[0][0][0]
-    return translated_text
+"""
+Async client for the Google Translate endpoint used by `,translate`.
+
+Requests share one aiohttp session, translations are cached,
+and long messages are split into chunks that are translated concurrently.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+
+import aiohttp
+
+TRANSLATE_URL = "https://translate.googleapis.com/translate_a/single"
+MAX_CHUNK_LENGTH = 1000  # characters sent in a single request
+MAX_CACHED = 1024  # translations kept before the least recently used are dropped
+TIMEOUT = aiohttp.ClientTimeout(total=15)
+
+_session = None
+_cache = OrderedDict()  # (text, source language, target language): translation, least recently used first
+
+
+def get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=TIMEOUT)
+    return _session
+
+
+async def close() -> None:
+    """
+    Closes the shared session. Called when the bot shuts down.
+    """
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def split_text(text: str, max_length: int = MAX_CHUNK_LENGTH) -> list[str]:
+    """
+    Splits text into chunks of at most `max_length` characters, preferably after a line, sentence or word.
+    Joining the chunks gives back the original text.
+    """
+    chunks = []
+    while len(text) > max_length:
+        window = text[:max_length]
+        for separator in ("\n", ". ", " "):
+            cut = window.rfind(separator)
+            if cut > 0:
+                cut += len(separator)
+                break
+        else:
+            cut = max_length  # a single very long word
+        chunks.append(text[:cut])
+        text = text[cut:]
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+async def _translate_chunk(chunk: str, source_language: str, target_language: str) -> str:
+    params = {"client": "gtx", "sl": source_language, "tl": target_language, "dt": "t", "q": chunk}
+    async with get_session().get(TRANSLATE_URL, params=params) as response:
+        response.raise_for_status()
+        data = await response.json(content_type=None)
+
+    # the translation comes in one segment per sentence
+    translated = "".join(segment[0] for segment in data[0] if segment[0])
+    trailing_space = chunk[len(chunk.rstrip()):]  # keep the whitespace the chunks were split at
+    return translated.rstrip() + trailing_space
+
+
+async def translate_text(text: str, source_language: str = "auto", target_language: str = "en") -> str:
+    """
+    Returns the translation of `text` from `source_language` (detected if "auto") to `target_language`.
+    """
+    key = (text, source_language, target_language)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    chunks = split_text(text)
+    translated = await asyncio.gather(*(_translate_chunk(c, source_language, target_language) for c in chunks))
+    translation = "".join(translated)
+
+    _cache[key] = translation
+    while len(_cache) > MAX_CACHED:
+        _cache.popitem(last=False)
+    return translation
@@ -0,0 +1,121 @@
+"""
+In-memory cache in front of the `user_data` table.
+
+Every message and slash command updates the sender's experience, so changes are kept in memory
+and written to the database in batches instead of after every message.
+Users without any data (who never connected an account) are remembered too, so their messages
+don't cost a database query either.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import time
+
+import metrics
+import rank_index
+from user_data import UserData, get_user_data, save_many
+
+FLUSH_INTERVAL = 60  # seconds between writes of changed users to the database
+MISSING_TTL = 600  # seconds to remember that a user has no data
+
+_hits = metrics.CACHE_REQUESTS.labels("user", "hit")
+_misses = metrics.CACHE_REQUESTS.labels("user", "miss")
+
+_users = {}  # user_id: UserData
+_missing = {}  # user_id: time when we found out that the user has no data
+_loading = {}  # user_id: task loading the user from the database
+_dirty = set()  # ids of users changed since the last flush
+_flush_task = None
+
+
+async def get_user(user_id: int) -> UserData | None:
+    """
+    Returns the cached data of a user, loading it from the database if needed.
+    Returns `None` if the user has no data, and raises an exception if the database could not be reached.
+    Changes to the returned object must be reported with `mark_dirty`.
+    """
+    if user_id in _users:
+        _hits.inc()
+        return _users[user_id]
+
+    missing_since = _missing.get(user_id)
+    if missing_since is not None and time.time() - missing_since < MISSING_TTL:
+        _hits.inc()
+        return None
+    _misses.inc()
+
+    # share a single query between everyone asking for the same user
+    if user_id not in _loading:
+        _loading[user_id] = asyncio.ensure_future(get_user_data(user_id))
+        _loading[user_id].add_done_callback(lambda _: _loading.pop(user_id, None))
+    # the query keeps going for the others waiting on it even if this caller is cancelled
+    user_data = await asyncio.shield(_loading[user_id])
+
+    if user_id in _users:  # added while we were waiting
+        return _users[user_id]
+    if user_data is None:
+        _missing[user_id] = time.time()
+    else:
+        put(user_data)
+    return user_data
+
+
+def put(user_data: UserData) -> None:
+    """
+    Adds a user that was just loaded from or saved to the database to the cache.
+    """
+    _users[user_data.user_id] = user_data
+    _missing.pop(user_data.user_id, None)
+    rank_index.update(user_data.user_id, user_data.experience)
+
+
+def mark_dirty(user_data: UserData) -> None:
+    """
+    Marks a user as changed so it is written to the database on the next flush.
+    """
+    put(user_data)
+    _dirty.add(user_data.user_id)
+
+
+async def flush() -> None:
+    """
+    Writes every changed user to the database now.
+    """
+    if not _dirty:
+        return
+    # copy the objects since they can keep changing while the query runs
+    users = [copy.copy(_users[user_id]) for user_id in _dirty]
+    _dirty.clear()
+    try:
+        await save_many(users)
+    except Exception as e:
+        print("Failed to save cached user data to db: " + str(e))
+        _dirty.update(u.user_id for u in users)  # try again on the next flush
+
+
+async def _flush_periodically() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await flush()
+
+
+def start() -> None:
+    """
+    Starts writing changed users to the database every `FLUSH_INTERVAL` seconds.
+    """
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_periodically())
+
+
+async def stop() -> None:
+    """
+    Stops the periodic writes and writes every remaining change. Called when the bot shuts down.
+    """
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    await flush()
@@ -1,11 +1,15 @@
 from __future__ import annotations
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 
+import asyncio
 import os
-import mysql.connector as connector
-from mysql.connector import pooling
+import time
+import aiomysql
 from dotenv import load_dotenv
 
+import metrics
+
 # connect to database
 load_dotenv("environment/.env")
 database_password = os.getenv("DATABASE_PASSWORD")
@@ -14,10 +18,61 @@ dbconfig = {
     "host": "localhost",
     "user": "root",
     "password": database_password,
-    "database": "coding_club_bot"
+    "db": "coding_club_bot"
 }
-pool = pooling.MySQLConnectionPool(pool_name="main_pool", pool_size=5, **dbconfig)
-print("Database pool successfully created")
+POOL_SIZE = 5
+
+pool = None
+_pool_lock = asyncio.Lock()
+
+# every query is a constant string; values are always passed as parameters
+COLUMNS = "user_id, dmoj_username, user_level, experience, messages, next_experience_gain_time"
+SELECT_USER = f"SELECT {COLUMNS} FROM user_data WHERE user_id = %s"
+SELECT_ALL_EXPERIENCE = "SELECT user_id, experience FROM user_data"
+UPSERT_USER = f"""
+INSERT INTO user_data ({COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+dmoj_username = VALUES(dmoj_username),
+user_level = VALUES(user_level),
+experience = VALUES(experience),
+messages = VALUES(messages),
+next_experience_gain_time = VALUES(next_experience_gain_time)
+"""
+
+
+async def get_pool() -> aiomysql.Pool:
+    """
+    Returns the database connection pool, creating it on first use.
+    """
+    global pool
+    async with _pool_lock:
+        if pool is None:
+            # without autocommit, reads leave a transaction open and the pool closes the connection on release
+            pool = await aiomysql.create_pool(minsize=1, maxsize=POOL_SIZE, autocommit=True, **dbconfig)
+            metrics.DB_POOL_IN_USE.set_function(lambda: pool.size - pool.freesize if pool is not None else 0)
+            print("Database pool successfully created")
+    return pool
+
+
+@asynccontextmanager
+async def connection():
+    """
+    Checks out a connection from the pool, recording how long we had to wait for it.
+    """
+    db_pool = await get_pool()
+    start = time.perf_counter()
+    async with db_pool.acquire() as db:
+        metrics.DB_POOL_WAIT.observe(time.perf_counter() - start)
+        yield db
+
+
+async def close_pool() -> None:
+    global pool
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+        pool = None
+
 
 """
 Contains data for a particular bot user.
@@ -60,75 +115,64 @@ class UserData:
         """Ensure user_id is an integer since the database stores them as str"""
         self.user_id = int(self.user_id)
 
-    def save_to_db(self) -> None:
+    def to_row(self) -> tuple:
+        """
+        Returns the values of this object in the order of the database columns.
+        """
+        return (str(self.user_id), self.dmoj_username, self.level, self.experience, self.messages,
+                self.next_experience_gain_time)
+
+    async def save_to_db(self) -> None:
         """
-        Saves this object's user data to the database.
+        Saves this object's user data to the database, adding the user if they don't exist yet.
         """
-        db = pool.get_connection()
         try:
-            with db.cursor() as control:
-                # add user to database if it doesn't exist yet
-                control.execute(f"SELECT * FROM user_data WHERE user_id = '{self.user_id}'")
-                if not control.fetchone():  # doesn't exist yet
-                    control.execute(f"INSERT INTO user_data VALUES ('{self.user_id}', '', 0, 0, 0, 0)")
-                    db.commit()
-
-                # update the user_object's information in the database
-                query = f"""
-                UPDATE user_data SET 
-                user_id = '{self.user_id}',
-                dmoj_username = %s,
-                user_level = {self.level},
-                experience = {self.experience},
-                messages = {self.messages},
-                next_experience_gain_time = {self.next_experience_gain_time}
-                WHERE user_id = '{self.user_id}'
-                """
-                control.execute(query, [self.dmoj_username])
-                db.commit()
+            async with connection() as db:
+                async with db.cursor() as control:
+                    await control.execute(UPSERT_USER, self.to_row())
         except Exception as e:
             print("Failed to save to db: " + str(e))
-        finally:
-            db.close()
 
 
-def get_user_data(user_id: int) -> UserData | None:
+async def get_user_data(user_id: int) -> UserData | None:
     """
     Returns a UserData object containing the given user's data.
     Returns `None` if the given id does not exist in the database.
+    Raises an exception if the data could not be fetched.
+    """
+    async with connection() as db:
+        async with db.cursor() as control:
+            await control.execute(SELECT_USER, (str(user_id),))
+            row = await control.fetchone()
+            return UserData(*row) if row else None
+
+
+async def save_many(users: list[UserData]) -> None:
+    """
+    Saves the data of several users in a single statement.
+    Raises an exception if the data could not be saved.
     """
-    db = pool.get_connection()
-    try:
-        with db.cursor() as control:
-            control.execute(f"SELECT * FROM user_data WHERE user_id = '{user_id}'")
-            try:
-                return UserData(*next(control))  # Return first and only element returned from query
-            except StopIteration:
-                return None
-    except Exception as e:
-        print("Failed to fetch user data from db: " + str(e))
-    finally:
-        db.close()
+    async with connection() as db:
+        async with db.cursor() as control:
+            await control.executemany(UPSERT_USER, [u.to_row() for u in users])
 
 
-def get_top_users():
+async def get_all_experience() -> list[tuple[int, int]]:
     """
-    Returns data for the top users in the server.
-    At most 10 entries will be returned.
+    Returns the (user id, experience) of every user in the database.
     """
-    db = pool.get_connection()
-    try:
-        with db.cursor() as control:
-            control.execute("SELECT * FROM user_data ORDER BY experience DESC LIMIT 10")
-            return [UserData(*user) for user in control]
-    except Exception as e:
-        print("Failed to fetch top users from db: " + str(e))
-    finally:
-        db.close()
+    async with connection() as db:
+        async with db.cursor() as control:
+            await control.execute(SELECT_ALL_EXPERIENCE)
+            return [(int(user_id), experience) for user_id, experience in await control.fetchall()]
 
 
 if __name__ == '__main__':
-    dt = get_user_data(123)
-    dt.level = 9999999
-    dt.dmoj_username = "Hello world"
-    dt.save_to_db()
+    async def main():
+        dt = await get_user_data(123)
+        dt.level = 9999999
+        dt.dmoj_username = "Hello world"
+        await dt.save_to_db()
+        await close_pool()
+
+    asyncio.run(main())